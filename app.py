@@ -1,23 +1,49 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, make_response, session
+from flask import Flask, render_template, request, redirect, url_for, flash, make_response, session, jsonify, send_file, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from functools import wraps # Import wraps
-from email_service import send_welcome_email, send_order_confirmation_email, send_payment_receipt_email, send_deposit_refund_confirmation_email # Import email functions
-import csv # Import csv
-import io # Import io
+from email_service import send_welcome_email, send_order_confirmation_email, send_payment_receipt_email # Import email functions
 import os # Import os
-from werkzeug.utils import secure_filename # Import secure_filename
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///gadget.db'
 app.config['SECRET_KEY'] = 'your_secret_key' # Replace with a strong secret key
+app.config['CART_HOLD_MINUTES'] = 15 # How long a cart item reserves stock without activity
+app.config['SCHEDULER_WORKERS'] = 4 # Background job threads per process
+app.config['RUN_SCHEDULER'] = os.environ.get('RUN_SCHEDULER') == '1' # Set for gunicorn workers; scripts that import app never start jobs
+app.config['JOB_LEASE_SECONDS'] = 300 # Renewed while a job runs; a job whose worker died is re-run a lease period after it lapses
+app.config['CART_REMINDER_AFTER_HOURS'] = 24 # Cart idle this long counts as abandoned
+app.config['CART_REMINDER_COOLDOWN_HOURS'] = 72 # Never remind the same user more often than this
+app.config['FRAGMENT_CACHE_MAX_BYTES'] = 8 * 1024 * 1024 # Rendered card/page cache budget per process
+app.config['GADGET_VIEW_FLUSH_SECONDS'] = 60 # How often each process writes the detail page views it has counted
+app.config['SUGGEST_REFRESH_SECONDS'] = 30 # How often a worker checks whether its suggest index is stale
+app.config['SEARCH_CACHE_MAX_ENTRIES'] = 1000 # Catalog search result lists kept per process
+app.config['SEARCH_CACHE_TTL_SECONDS'] = 300
+app.config['TRENDING_HALF_LIFE_DAYS'] = 14 # A rental counts half as much towards "trending" after this long
+app.config['RECOMMENDATIONS_PER_GADGET'] = 6 # Co-rental neighbours stored per gadget
+app.config['REPORT_CACHE_MAX_ENTRIES'] = 200 # Admin report results kept per process
+app.config['REPORT_CACHE_STALE_SECONDS'] = 600 # Serve an outdated report this long while it refreshes in the background
+app.config['ORDER_ARCHIVE_AFTER_DAYS'] = 180 # Closed orders older than this move to the archive table
+app.config['ORDER_ARCHIVE_BATCH_SIZE'] = 5000 # Orders moved per archival transaction
+app.config['NOTIFICATION_RETENTION_DAYS'] = 90 # Notifications older than this are deleted
+app.config['NOTIFICATION_MAX_PER_USER'] = 200 # Newest notifications kept per user
+app.config['NOTIFICATION_COMPACT_AFTER_DAYS'] = 7 # Read notifications older than this fold into a daily digest
+app.config['NOTIFICATION_DELETE_BATCH'] = 5000 # Rows deleted or compacted per transaction
+app.config['STATIC_SERVING'] = os.environ.get('STATIC_SERVING', 'flask') # flask | sendfile | accel, see static_files.py
 
 
 UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif','webp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 # Larger request bodies are rejected with 413 before being read
+app.config['REPORT_EXPORT_FOLDER'] = os.path.join(app.instance_path, 'exports') # Background report files, see report_exports.py
+app.config['BACKUP_FOLDER'] = os.path.join(app.instance_path, 'backups') # Database backups and snapshots, see backup.py
+app.config['BACKUP_PAGES_PER_STEP'] = 256 # Pages copied per backup step while holding the read lock
+app.config['BACKUP_STEP_PAUSE'] = 0.005 # Seconds between backup steps, so writers can get in
+app.config['BACKUP_MAX_RESTARTS'] = 3 # Concurrent writes restart a backup; after this many it copies in one step
+app.config['BACKUP_KEEP'] = 7 # Backups (and snapshots) kept by the daily job
 
 def allowed_file(filename):
     if not filename:
@@ -34,7 +60,37 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 # Import models after db and login_manager are initialized
-from models import User, Gadget, CartItem, RentalOrder, Review, Wishlist, Notification, Feedback, Coupon # Import Feedback model
+from models import User, Gadget, CartItem, RentalOrder, Review, Wishlist, Notification, Feedback, Coupon, OverdueRental, ReportExport, ArchivedRentalOrder # Import Feedback model
+from order_workflow import ORDER_TRANSITIONS, apply_transition, rental_price, sweep_overdue_orders
+from inventory import (available_stock, availability_key, hold_cart_item, set_cart_item_quantity,
+                       release_cart_item, release_user_holds, renew_user_holds, release_expired_holds,
+                       record_movements, reconcile_stock, take_stock_snapshots)
+from scheduler import register_task, start_scheduler, prune_job_history, job_stats, enqueue
+from trust import apply_trust_events, recompute_trust_scores
+from trending import trending_weight, recompute_trending_scores
+from recommendations import rebuild_recommendations, related_gadgets
+from reports import (utilization_report, parse_report_range, report_csv, REPORTS, EXPORT_FORMATS,
+                     user_order_summaries, empty_order_summary)
+from report_cache import report_cache, init_report_cache
+from order_archive import archive_closed_orders, order_history, find_order
+from report_exports import queue_report_export, generate_report_export, prune_report_exports, export_filename
+from backup import scheduled_backup
+from notification_service import send_cart_reminders, send_cart_reminder_emails, compact_notifications, notification_stats
+from uploads import store_upload, release_upload
+from images import (gadget_picture, generate_image_variants, backfill_image_variants, forget_image_variants,
+                    delete_image_variants, reset_missing_images)
+from static_files import init_static_serving
+from search_index import suggest_index
+from search_cache import search_cache, init_search_cache, normalize_catalog_query, hydrate_gadgets
+from page_cache import (conditional_page, cached_for_anonymous, record_gadget_view, flush_gadget_views,
+                        init_page_cache, touch_gadget_card, fragment_cache)
+
+init_static_serving(app)
+init_page_cache(app)
+init_search_cache(app)
+init_report_cache(app)
+
+app.jinja_env.globals['gadget_picture'] = gadget_picture
 
 # Admin Required Decorator
 def admin_required(f):
@@ -50,19 +106,28 @@ def admin_required(f):
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+@app.errorhandler(413)
+def request_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f"Upload is too large. The maximum size is {limit_mb} MB.", "danger")
+    return redirect(request.referrer or url_for('home'))
+
 # --- Routes ---
 @app.route('/')
+@conditional_page('gadget')
+@cached_for_anonymous('gadget')
 def home():
     featured = Gadget.query.filter_by(is_active=True, is_featured=True) \
                            .order_by(Gadget.created_at.desc()).limit(9).all()
     if not featured:
         featured = Gadget.query.filter_by(is_active=True) \
-                               .order_by(Gadget.rental_count.desc()).limit(9).all()
+                               .order_by(Gadget.trending_score.desc()).limit(9).all()
     categories = [c[0] for c in db.session.query(Gadget.category).distinct()]
     return render_template('home.html', featured=featured, categories=categories)
 
 
 @app.route('/gadgets')
+@conditional_page('gadget')
 def gadgets():
     category = request.args.get('category')
     search_query = request.args.get('search')
@@ -70,38 +135,37 @@ def gadgets():
     max_price = request.args.get('max_price', type=float)
     sort_by = request.args.get('sort_by', 'popularity')
 
-    gadgets_query = Gadget.query.filter_by(is_active=True)
-
-    if category:
-        gadgets_query = gadgets_query.filter_by(category=category)
-    if search_query:
-        gadgets_query = gadgets_query.filter(Gadget.name.ilike(f'%{search_query}%'))
-    if min_price:
-        gadgets_query = gadgets_query.filter(Gadget.price_per_day >= min_price)
-    if max_price:
-        gadgets_query = gadgets_query.filter(Gadget.price_per_day <= max_price)
-
-    if sort_by == 'price_low_high':
-        gadgets_query = gadgets_query.order_by(Gadget.price_per_day.asc())
-    elif sort_by == 'popularity':
-        gadgets_query = gadgets_query.order_by(Gadget.rental_count.desc())
-    elif sort_by == 'newest':
-        gadgets_query = gadgets_query.order_by(Gadget.created_at.desc())
-    
-    gadgets = gadgets_query.all()
+    # Matching ids come from the search cache; the gadgets themselves are loaded by id
+    key = normalize_catalog_query(category, search_query, min_price, max_price, sort_by)
+    gadgets = hydrate_gadgets(search_cache.gadget_ids(key))
     categories = [g.category for g in Gadget.query.with_entities(Gadget.category).distinct()]
 
     return render_template('gadgets.html', gadgets=gadgets, categories=categories,
                            selected_category=category, search_query=search_query,
                            min_price=min_price, max_price=max_price, sort_by=sort_by)
 
+@app.route('/api/suggest')
+def suggest():
+    prefix = request.args.get('q', '')[:50]
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    suggest_index.refresh_if_stale()
+    return jsonify([
+        {'id': gadget_id, 'name': name, 'category': category,
+         'url': url_for('gadget_detail', gadget_id=gadget_id)}
+        for gadget_id, name, category in suggest_index.suggest(prefix, limit=limit)
+    ])
+
 @app.route('/gadget/<int:gadget_id>')
 def gadget_detail(gadget_id):
+    record_gadget_view(gadget_id)  # written in bulk by this process's view flusher, see page_cache.py
+    return gadget_detail_page(gadget_id=gadget_id)
+
+@conditional_page('gadget', 'review', 'user', 'gadget_recommendation', validator=availability_key)  # cart holds change free units
+def gadget_detail_page(gadget_id):
     gadget = Gadget.query.get_or_404(gadget_id)
-    gadget.view_count += 1
     reviews = Review.query.filter_by(gadget_id=gadget.id).order_by(Review.created_at.desc()).all()
-    db.session.commit()
-    return render_template('gadget_detail.html', gadget=gadget, reviews=reviews)
+    related = related_gadgets(gadget.id)
+    return render_template('gadget_detail.html', gadget=gadget, reviews=reviews, related=related)
 
 @app.route('/add-to-cart/<int:gadget_id>', methods=['POST'])
 @login_required
@@ -135,25 +199,34 @@ def add_to_cart(gadget_id):
         flash('Maximum rental period is 30 days.', 'danger')
         return redirect(url_for('gadget_detail', gadget_id=gadget.id))
 
-    # Basic stock availability check (will be enhanced during order placement)
+    # Reserve one unit for this cart (hold expires unless the cart stays active)
     existing_cart_item = CartItem.query.filter_by(user_id=current_user.id, gadget_id=gadget.id, 
                                                  start_date=start_date, end_date=end_date).first()
+    cart_item = existing_cart_item or CartItem(user_id=current_user.id, gadget_id=gadget.id,
+                                               start_date=start_date, end_date=end_date, quantity=0)
+
+    if not hold_cart_item(cart_item, 1):
+        db.session.rollback()
+        flash(f'Sorry, all units of {gadget.name} are currently rented or reserved.', 'danger')
+        return redirect(url_for('gadget_detail', gadget_id=gadget.id))
 
     if existing_cart_item:
-        existing_cart_item.quantity += 1
         flash('Gadget quantity updated in cart.', 'info')
     else:
-        new_cart_item = CartItem(user_id=current_user.id, gadget_id=gadget.id,
-                                 start_date=start_date, end_date=end_date, quantity=1)
-        db.session.add(new_cart_item)
+        db.session.add(cart_item)
         flash('Gadget added to cart!', 'success')
     
+    renew_user_holds(current_user.id)
     db.session.commit()
     return redirect(url_for('cart'))
 
 @app.route('/cart', methods=['GET', 'POST'])
 @login_required
 def cart():
+    # Viewing the cart counts as activity: keep (or re-acquire) its holds
+    renew_user_holds(current_user.id)
+    db.session.commit()
+
     cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
     total_cart_price = 0
     promo_code_applied = None
@@ -161,7 +234,7 @@ def cart():
 
     for item in cart_items:
         total_days = (item.end_date - item.start_date).days + 1
-        item.subtotal = item.gadget.price_per_day * item.quantity * total_days
+        item.subtotal = rental_price(item.gadget.price_per_day, item.quantity, total_days)
         total_cart_price += item.subtotal
     
     if request.method == 'POST':
@@ -196,9 +269,12 @@ def update_cart(item_id):
 
     quantity = request.form.get('quantity', type=int)
     if quantity is not None and quantity > 0:
-        cart_item.quantity = quantity
-        db.session.commit()
-        flash('Cart updated successfully.', 'success')
+        if set_cart_item_quantity(cart_item, quantity):
+            db.session.commit()
+            flash('Cart updated successfully.', 'success')
+        else:
+            db.session.rollback()
+            flash(f'Only {available_stock(cart_item.gadget)} more unit(s) of {cart_item.gadget.name} available.', 'danger')
     else:
         flash('Invalid quantity.', 'danger')
     return redirect(url_for('cart'))
@@ -211,6 +287,7 @@ def remove_from_cart(item_id):
         flash('You are not authorized to remove this cart item.', 'danger')
         return redirect(url_for('cart'))
     
+    release_cart_item(cart_item)
     db.session.delete(cart_item)
     db.session.commit()
     flash('Item removed from cart.', 'info')
@@ -219,6 +296,7 @@ def remove_from_cart(item_id):
 @app.route('/clear-cart')
 @login_required
 def clear_cart():
+    release_user_holds(current_user.id)
     CartItem.query.filter_by(user_id=current_user.id).delete()
     db.session.commit()
     flash('Your cart has been cleared.', 'info')
@@ -239,7 +317,7 @@ def checkout():
 
     for item in cart_items:
         total_days = (item.end_date - item.start_date).days + 1
-        item.subtotal = item.gadget.price_per_day * item.quantity * total_days
+        item.subtotal = rental_price(item.gadget.price_per_day, item.quantity, total_days)
         total_rental_price += item.subtotal
 
     # Always initialize deposit
@@ -266,15 +344,18 @@ def checkout():
         db.session.commit()
 
         # --- Stock Availability Check before placing order ---
+        # Held items already have their units reserved; lapsed ones compete for free stock
         for item in cart_items:
-            if item.gadget.stock < item.quantity:
-                flash(f'Not enough stock for {item.gadget.name}. Available: {item.gadget.stock}', 'danger')
+            available = item.gadget.stock if item.hold_expires_at else available_stock(item.gadget)
+            if available < item.quantity:
+                flash(f'Not enough stock for {item.gadget.name}. Available: {max(available, 0)}', 'danger')
                 return redirect(url_for('cart'))
 
         # --- Create Orders ---
+        new_orders = []
         for item in cart_items:
             total_days = (item.end_date - item.start_date).days + 1
-            total_price_item = item.gadget.price_per_day * item.quantity * total_days
+            total_price_item = rental_price(item.gadget.price_per_day, item.quantity, total_days)
             item_deposit_amount = 0
             if item.gadget.price_per_day * total_days > 1000: # Recalculate deposit for order creation
                 item_deposit_amount = total_price_item * 0.5
@@ -284,6 +365,7 @@ def checkout():
                 gadget_id=item.gadget.id,
                 start_date=item.start_date,
                 end_date=item.end_date,
+                quantity=item.quantity,
                 total_days=total_days,
                 total_price=total_price_item,
                 security_deposit=item_deposit_amount, 
@@ -293,9 +375,15 @@ def checkout():
                 payment_status='pending'
             )
             db.session.add(new_order)
-            item.gadget.stock -= item.quantity # Reduce stock
+            new_orders.append((new_order, item))
             item.gadget.rental_count += item.quantity # Increase rental count
+            item.gadget.trending_score = (item.gadget.trending_score or 0.0) + trending_weight(item.quantity)
+
+        db.session.flush() # Assign order ids for the stock ledger
+        record_movements([(item.gadget_id, -item.quantity, 'checkout', order.id)
+                          for order, item in new_orders]) # Reduce stock
         
+        release_user_holds(current_user.id) # Reserved units are now taken out of stock
         CartItem.query.filter_by(user_id=current_user.id).delete() # Clear cart after placing order
         db.session.commit()
         flash('Your order has been placed successfully!', 'success')
@@ -431,17 +519,28 @@ def payment():
 @app.route('/orders')
 @login_required
 def orders():
-    user_orders = RentalOrder.query.filter_by(user_id=current_user.id).order_by(RentalOrder.created_at.desc()).all()
-    return render_template('orders.html', orders=user_orders, today=datetime.utcnow().date())
+    # Live orders only, unless the user asks for their archived ones as well
+    show_archived = request.args.get('archived') == '1'
+    source = order_history() if show_archived else RentalOrder
+    user_orders = db.session.query(source).filter(source.user_id == current_user.id) \
+                            .order_by(source.created_at.desc()).all()
+    has_archived = not show_archived and db.session.query(
+        ArchivedRentalOrder.query.filter_by(user_id=current_user.id).exists()
+    ).scalar()
+    return render_template('orders.html', orders=user_orders, today=datetime.utcnow().date(),
+                           show_archived=show_archived, has_archived=has_archived)
 
 @app.route('/orders/<int:order_id>')
 @login_required
 def order_details(order_id):
-    order = RentalOrder.query.get_or_404(order_id)
+    order = find_order(order_id)
+    if order is None:
+        abort(404)
     if order.user_id != current_user.id:
         flash('You are not authorized to view this order.', 'danger')
         return redirect(url_for('orders'))
-    return render_template('order_details.html', order=order, today=datetime.utcnow().date())
+    return render_template('order_details.html', order=order, today=datetime.utcnow().date(),
+                           archived=isinstance(order, ArchivedRentalOrder))
 
 @app.route('/cancel-order/<int:order_id>')
 @login_required
@@ -457,9 +556,11 @@ def cancel_order(order_id):
 
         # Restore stock ONLY IF stock was previously deducted
         if order.payment_status in ['paid', 'pending']:  
-            order.gadget.stock += 1
+            record_movements([(order.gadget_id, order.quantity or 1, 'cancel', order.id)])
 
         order.status = 'cancelled'
+        order.cancelled_by = 'user'
+        apply_trust_events([(current_user.id, 'cancelled')])
         db.session.commit()
         flash('Order cancelled successfully.', 'success')
     else:
@@ -502,11 +603,13 @@ def submit_review(order_id):
         )
 
         db.session.add(review)
+        apply_trust_events([(current_user.id, 'review')])
         db.session.commit()
 
         # Recalculate average rating
         reviews = Review.query.filter_by(gadget_id=order.gadget.id).all()
         order.gadget.avg_rating = sum(r.rating for r in reviews) / len(reviews)
+        touch_gadget_card(order.gadget)
         db.session.commit()
 
         # 🔔 NEW: Add user notification
@@ -524,6 +627,7 @@ def submit_review(order_id):
 
 
 @app.route('/reviews')
+@conditional_page('review', 'user', 'gadget')
 def reviews():
     all_reviews = Review.query.order_by(Review.created_at.desc()).all()
     return render_template('reviews.html', reviews=all_reviews)
@@ -559,18 +663,22 @@ def admin_dashboard():
     today_revenue = db.session.query(
         db.func.sum(RentalOrder.total_price)
     ).filter(
-        db.func.date(RentalOrder.created_at) == today,
+        RentalOrder.created_date == today,
         RentalOrder.payment_status == 'paid'
     ).scalar() or 0
 
+    all_orders = order_history()
     total_revenue = db.session.query(
-        db.func.sum(RentalOrder.total_price)
-    ).filter(RentalOrder.payment_status == 'paid').scalar() or 0
+        db.func.sum(all_orders.total_price)
+    ).filter(all_orders.payment_status == 'paid').scalar() or 0
 
     # LOW STOCK ITEMS (< 3)
     low_stock_items = Gadget.query.filter(Gadget.stock < 3).all()
     low_stock_alerts = len(low_stock_items)
 
+    # Precomputed by the overdue sweep job
+    overdue_rentals = OverdueRental.query.count()
+
     return render_template(
         "admin/admin_dashboard.html",
         total_gadgets=total_gadgets,
@@ -579,7 +687,8 @@ def admin_dashboard():
         total_revenue=total_revenue,
         pending_approvals=pending_approvals,
         low_stock_alerts=low_stock_alerts,
-        low_stock_items=low_stock_items
+        low_stock_items=low_stock_items,
+        overdue_rentals=overdue_rentals
     )
 
 
@@ -596,197 +705,101 @@ def admin_orders():
     all_orders = orders_query.all()
     return render_template('admin/admin_orders.html', orders=all_orders, selected_status=status_filter)
 
-@app.route('/admin/order/<int:order_id>/approve')
-@login_required
-@admin_required
-def admin_approve_order(order_id):
+def _admin_order_action(order_id, action, error_message):
     order = RentalOrder.query.get_or_404(order_id)
-
-    if order.status == 'booked':
-        order.status = 'approved'
-
-        # 🔔 Create notification for user
-        notification = Notification(
-            user_id=order.user_id,
-            message=f"Your order #{order.id} has been approved."
-        )
-        db.session.add(notification)
-
-        db.session.commit()  # ✅ Single commit for both updates
-
-        flash(f"Order {order.id} approved.", "success")
-
+    applied, _ = apply_transition(action, [order.id])
+    if applied:
+        flash(f"Order {order_id} {ORDER_TRANSITIONS[action]['done']}.", "success")
     else:
-        flash(f"Order {order.id} cannot be approved from current status.", "danger")
-
+        flash(error_message.format(id=order_id), "danger")
     return redirect(url_for('admin_orders'))
 
 
-@app.route('/admin/order/<int:order_id>/reject')
+@app.route('/admin/orders/overdue')
 @login_required
 @admin_required
-def admin_reject_order(order_id):
-    order = RentalOrder.query.get_or_404(order_id)
-
-    if order.status == 'booked':
-        
-        # Return stock because stock was already reduced at checkout
-        order.gadget.stock += 1
+def admin_overdue_orders():
+    overdue = OverdueRental.query.order_by(OverdueRental.days_overdue.desc()).all()
+    total_late_fees = db.session.query(db.func.sum(OverdueRental.late_fee)).scalar() or 0
+    refreshed_at = db.session.query(db.func.max(OverdueRental.refreshed_at)).scalar()
+    return render_template('admin/admin_overdue.html', overdue=overdue,
+                           total_late_fees=total_late_fees, refreshed_at=refreshed_at)
 
-        order.status = 'cancelled'
-        db.session.commit()
-
-        # 🔔 Notify user
-        db.session.add(Notification(
-            user_id=order.user_id,
-            message=f"Your order #{order.id} has been rejected."
-        ))
-        db.session.commit()
+@app.route('/admin/order/<int:order_id>/approve')
+@login_required
+@admin_required
+def admin_approve_order(order_id):
+    return _admin_order_action(order_id, 'approve',
+                               "Order {id} cannot be approved from current status.")
 
-        flash(f'Order {order.id} rejected.', 'info')
 
-    else:
-        flash(f'Order {order.id} cannot be rejected from current status.', 'danger')
-
-    return redirect(url_for('admin_orders'))
+@app.route('/admin/order/<int:order_id>/reject')
+@login_required
+@admin_required
+def admin_reject_order(order_id):
+    return _admin_order_action(order_id, 'reject',
+                               "Order {id} cannot be rejected from current status.")
 
 
 @app.route('/admin/order/<int:order_id>/mark-active')
 @login_required
 @admin_required
 def admin_mark_active(order_id):
-    order = RentalOrder.query.get_or_404(order_id)
-
-    if order.status == 'approved':
-        order.status = 'active'
-
-        # 🔔 Notify user
-        notification = Notification(
-            user_id=order.user_id,
-            message=f"Your order #{order.id} is now Active and being processed."
-        )
-        db.session.add(notification)
-
-        db.session.commit()  # ✅ One commit for everything
-
-        flash(f"Order {order.id} marked as Active.", "success")
-    else:
-        flash(f"Order {order.id} cannot be marked active from current status.", "danger")
-
-    return redirect(url_for('admin_orders'))
+    return _admin_order_action(order_id, 'mark_active',
+                               "Order {id} cannot be marked active from current status.")
 
 
 @app.route('/admin/order/<int:order_id>/mark-delivered')
 @login_required
 @admin_required
 def admin_mark_delivered(order_id):
-    order = RentalOrder.query.get_or_404(order_id)
-
-    if order.status == 'active':
-        order.status = 'delivered'
-
-        # 🔔 Notify user
-        notif = Notification(
-            user_id=order.user_id,
-            message=f"Your order #{order.id} has been delivered."
-        )
-        db.session.add(notif)
-
-        db.session.commit()
-        flash(f'Order {order.id} marked as delivered.', 'success')
-
-    else:
-        flash(f'Order {order.id} cannot be marked delivered from current status.', 'danger')
-
-    return redirect(url_for('admin_orders'))
+    return _admin_order_action(order_id, 'mark_delivered',
+                               "Order {id} cannot be marked delivered from current status.")
 
 
 @app.route('/admin/order/<int:order_id>/mark-returned')
 @login_required
 @admin_required
 def admin_mark_returned(order_id):
-    order = RentalOrder.query.get_or_404(order_id)
-
-    if order.status in ['delivered', 'active']:
-        order.status = 'returned'
-
-        # Return gadget to stock
-        order.gadget.stock += 1
-
-        # 🔔 Notify user
-        notif = Notification(
-            user_id=order.user_id,
-            message=f"Your order #{order.id} has been marked Returned. Thank you!"
-        )
-        db.session.add(notif)
-
-        db.session.commit()
-        flash(f'Order {order.id} marked as returned. Gadget stock updated.', 'success')
-
-    else:
-        flash(f'Order {order.id} cannot be marked returned from current status.', 'danger')
-
-    return redirect(url_for('admin_orders'))
+    return _admin_order_action(order_id, 'mark_returned',
+                               "Order {id} cannot be marked returned from current status.")
 
 
 @app.route('/admin/order/<int:order_id>/refund-deposit')
 @login_required
 @admin_required
 def admin_refund_deposit(order_id):
-    order = RentalOrder.query.get_or_404(order_id)
-
-    if order.status == 'returned' and not order.deposit_returned:
-        order.deposit_returned = True
-
-        # 🔔 Notify user
-        notif = Notification(
-            user_id=order.user_id,
-            message=f"Your security deposit for order #{order.id} has been refunded."
-        )
-        db.session.add(notif)
-
-        db.session.commit()
-
-        # Email confirmation
-        send_deposit_refund_confirmation_email(
-            order.user.email, order.user.name, order.id, order.security_deposit
-        )
-
-        flash(f'Deposit for order {order.id} refunded.', 'success')
-
-    else:
-        flash(f'Deposit for order {order.id} cannot be refunded.', 'danger')
-
-    return redirect(url_for('admin_orders'))
+    return _admin_order_action(order_id, 'refund_deposit',
+                               "Deposit for order {id} cannot be refunded.")
 
 
 @app.route('/admin/order/<int:order_id>/cancel')
 @login_required
 @admin_required
 def admin_cancel_order(order_id):
-    order = RentalOrder.query.get_or_404(order_id)
-
-    if order.status in ['cancelled', 'returned']:
-        flash("Order is already completed or cancelled.", "info")
-        return redirect(url_for('admin_orders'))
-
-    # Only return stock if order was active (stock already reduced)
-    if order.status in ['approved', 'active', 'delivered']:
-        order.gadget.stock += 1
+    return _admin_order_action(order_id, 'cancel',
+                               "Order {id} is already completed or cancelled.")
 
-    order.status = 'cancelled'
 
-    # Notify user
-    notif = Notification(
-        user_id=order.user_id,
-        message=f"Your order #{order.id} has been cancelled by the admin."
-    )
-    db.session.add(notif)
+@app.route('/admin/orders/bulk', methods=['POST'])
+@login_required
+@admin_required
+def admin_bulk_order_action():
+    action = request.form.get('action')
+    order_ids = request.form.getlist('order_ids', type=int)
 
-    db.session.commit()
-    flash(f"Order {order.id} cancelled successfully.", "success")
+    if action not in ORDER_TRANSITIONS:
+        flash('Please choose a valid action.', 'danger')
+        return redirect(url_for('admin_orders', status=request.form.get('status')))
+    if not order_ids:
+        flash('No orders selected.', 'info')
+        return redirect(url_for('admin_orders', status=request.form.get('status')))
 
-    return redirect(url_for('admin_orders'))
+    applied, skipped = apply_transition(action, order_ids)
+    flash(f"{len(applied)} order(s) {ORDER_TRANSITIONS[action]['done']}.", "success" if applied else "info")
+    if skipped:
+        flash(f"{len(skipped)} order(s) skipped: not in a valid status for this action.", "danger")
+    return redirect(url_for('admin_orders', status=request.form.get('status')))
 
 
 
@@ -920,14 +933,18 @@ def move_to_cart(item_id):
     today = datetime.utcnow().date()
     existing_cart_item = CartItem.query.filter_by(user_id=current_user.id, gadget_id=wishlist_item.gadget.id,
                                                  start_date=today, end_date=today).first()
+    cart_item = existing_cart_item or CartItem(user_id=current_user.id, gadget_id=wishlist_item.gadget.id,
+                                               start_date=today, end_date=today, quantity=0)
+
+    if not hold_cart_item(cart_item, 1):
+        db.session.rollback()
+        flash(f'Sorry, {wishlist_item.gadget.name} is currently rented or reserved.', 'danger')
+        return redirect(url_for('wishlist'))
+
+    if not existing_cart_item:
+        db.session.add(cart_item)
     
-    if existing_cart_item:
-        existing_cart_item.quantity += 1
-    else:
-        new_cart_item = CartItem(user_id=current_user.id, gadget_id=wishlist_item.gadget.id,
-                                 start_date=today, end_date=today, quantity=1)
-        db.session.add(new_cart_item)
-    
+    renew_user_holds(current_user.id)
     db.session.delete(wishlist_item) # Remove from wishlist after moving to cart
     db.session.commit()
     flash('Item moved to cart!', 'success')
@@ -936,12 +953,11 @@ def move_to_cart(item_id):
 @app.route('/notifications')
 @login_required
 def notifications():
-    user_notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).all()
-    # For simplicity, we'll mark them as read when viewed
-    for notif in user_notifications:
-        if not notif.is_read:
-            notif.is_read = True
+    # Viewing the page marks everything read, in one statement
+    Notification.query.filter(Notification.user_id == current_user.id, Notification.is_read == False) \
+                      .update({'is_read': True}, synchronize_session=False)
     db.session.commit()
+    user_notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).all()
     return render_template('notifications.html', notifications=user_notifications)
 
 
@@ -960,26 +976,16 @@ def mark_notification_read(notification_id):
 
 # Example of creating a notification (e.g., for new gadget alert - normally done by admin)
 def create_new_gadget_notification(gadget_name):
-    all_users = User.query.all()
-    for user in all_users:
-        new_notif = Notification(user_id=user.id, message=f'New gadget alert! Check out the {gadget_name}!')
-        db.session.add(new_notif)
+    message = f'New gadget alert! Check out the {gadget_name}!'
+    now = datetime.utcnow()
+    db.session.execute(db.insert(Notification), [
+        {'user_id': user_id, 'message': message, 'is_read': False, 'created_at': now}
+        for (user_id,) in db.session.query(User.id)
+    ])
     db.session.commit()
     print(f"Notifications created for new gadget: {gadget_name}")
 
-# Example of creating a cart reminder notification (would be a scheduled task)
-def create_cart_reminder_notification(user_id):
-    user = User.query.get(user_id)
-    if user:
-        cart_items = CartItem.query.filter_by(user_id=user_id).count()
-        if cart_items > 0:
-            # Check if a reminder was sent recently, to avoid spamming
-            # For simplicity, just send one for now
-            new_notif = Notification(user_id=user_id, message='You have items in your cart! Complete your order soon.')
-            db.session.add(new_notif)
-            db.session.commit()
-            print(f"Cart reminder notification sent to {user.email}")
-
+# Cart reminders run as a scheduled batch job: see notification_service.send_cart_reminders
 @app.route('/feedback', methods=['GET', 'POST'])
 @login_required
 def feedback():
@@ -1027,82 +1033,31 @@ def feedback():
 def admin_reports():
     return render_template('admin/admin_reports.html')
 
+def report_csv_response(report, rows, filename):
+    output = make_response(report_csv(report, rows))
+    output.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    output.headers["Content-type"] = "text/csv"
+    return output
+
 @app.route('/admin/reports/daily-revenue')
 @login_required
 @admin_required
 def daily_revenue_report():
     format_type = request.args.get('format')
+    try:
+        start, end = parse_report_range(request.args)
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "danger")
+        return redirect(url_for('daily_revenue_report'))
 
-    # Query raw results
-    raw_data = db.session.query(
-        db.func.date(RentalOrder.created_at).label("date"),
-        db.func.count(RentalOrder.id).label("orders"),
-        db.func.sum(RentalOrder.total_price).label("revenue"),
-        db.func.avg(RentalOrder.total_price).label("avg_revenue"),
-        db.func.max(RentalOrder.total_price).label("max_order"),
-        db.func.min(RentalOrder.total_price).label("min_order"),
-        db.func.count(db.func.distinct(RentalOrder.user_id)).label("unique_customers"),
-        db.func.sum(RentalOrder.total_days).label("total_days"),
-        db.func.avg(RentalOrder.total_days).label("avg_days")
-    ).filter(RentalOrder.payment_status == 'paid') \
-     .group_by(db.func.date(RentalOrder.created_at)) \
-     .order_by(db.func.date(RentalOrder.created_at).desc()) \
-     .all()
-
-    # Normalize data for template + CSV
-    data = []
-    for row in raw_data:
-        date_value = row.date
-
-        # Convert datetime → string
-        if hasattr(date_value, "strftime"):
-            date_str = date_value.strftime("%Y-%m-%d")
-        else:
-            date_str = str(date_value)
-
-        data.append({
-            "date": date_str,
-            "orders": row.orders,
-            "revenue": row.revenue or 0,
-            "avg_revenue": row.avg_revenue or 0,
-            "max_order": row.max_order or 0,
-            "min_order": row.min_order or 0,
-            "unique_customers": row.unique_customers,
-            "total_days": row.total_days or 0,
-            "avg_days": row.avg_days or 0
-        })
+    data = report_cache.rows('daily-revenue', start, end)
 
     # ----- CSV EXPORT -----
     if format_type == "csv":
-        si = io.StringIO()
-        writer = csv.writer(si)
-
-        writer.writerow([
-            "Date", "Total Orders", "Revenue (₹)", "Avg Revenue (₹)",
-            "Max Order (₹)", "Min Order (₹)",
-            "Unique Customers", "Total Rental Days", "Avg Rental Days"
-        ])
-
-        for row in data:
-            writer.writerow([
-                row["date"],
-                row["orders"],
-                f"{row['revenue']:.2f}",
-                f"{row['avg_revenue']:.2f}",
-                f"{row['max_order']:.2f}",
-                f"{row['min_order']:.2f}",
-                row["unique_customers"],
-                row["total_days"],
-                f"{row['avg_days']:.2f}"
-            ])
-
-        output = make_response(si.getvalue())
-        output.headers["Content-Disposition"] = "attachment; filename=daily_revenue_report.csv"
-        output.headers["Content-type"] = "text/csv"
-        return output
+        return report_csv_response('daily-revenue', data, "daily_revenue_report.csv")
 
     # Render HTML
-    return render_template("admin/reports/daily_revenue_report.html", data=data)
+    return render_template("admin/reports/daily_revenue_report.html", data=data, start=start, end=end)
 
 
 @app.route("/admin/reports/most-rented-gadgets")
@@ -1110,110 +1065,100 @@ def daily_revenue_report():
 @admin_required
 def most_rented_gadgets_report():
     format_type = request.args.get("format")
+    try:
+        start, end = parse_report_range(request.args)
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "danger")
+        return redirect(url_for('most_rented_gadgets_report'))
 
-    data = db.session.query(
-        Gadget.name.label("gadget"),
-        Gadget.category.label("category"),
-        db.func.count(RentalOrder.id).label("total_rentals"),
-        db.func.sum(RentalOrder.total_days).label("total_days"),
-        db.func.count(db.func.distinct(RentalOrder.user_id)).label("unique_users"),
-        db.func.sum(RentalOrder.total_price).label("total_revenue"),
-        db.func.avg(RentalOrder.total_price).label("avg_revenue"),
-        db.func.avg(RentalOrder.total_days).label("avg_days"),
-        db.func.max(RentalOrder.created_at).label("last_rented")
-    ).join(RentalOrder) \
-     .filter(RentalOrder.payment_status == "paid") \
-     .group_by(Gadget.id) \
-     .order_by(db.desc("total_rentals")) \
-     .all()
+    data = report_cache.rows('most-rented-gadgets', start, end)
 
     if format_type == "csv":
-        si = io.StringIO()
-        writer = csv.writer(si)
-
-        writer.writerow([
-            "Gadget", "Category", "Total Rentals", "Total Days",
-            "Unique Users", "Total Revenue (₹)", "Avg Revenue (₹)",
-            "Avg Days", "Last Rented"
-        ])
-
-        for row in data:
-            last_rented = row.last_rented.strftime("%Y-%m-%d") if row.last_rented else ""
-
-            writer.writerow([
-                row.gadget,
-                row.category,
-                row.total_rentals,
-                row.total_days,
-                row.unique_users,
-                f"{row.total_revenue:.2f}",
-                f"{row.avg_revenue:.2f}",
-                f"{row.avg_days:.2f}",
-                last_rented
-            ])
-
-        output = make_response(si.getvalue())
-        output.headers["Content-Disposition"] = "attachment; filename=most_rented_gadgets_report.csv"
-        output.headers["Content-type"] = "text/csv"
-        return output
-
-    return render_template("admin/reports/most_rented_gadgets_report.html", data=data)
+        return report_csv_response('most-rented-gadgets', data, "most_rented_gadgets_report.csv")
+
+    return render_template("admin/reports/most_rented_gadgets_report.html", data=data, start=start, end=end)
 
 @app.route('/admin/reports/user-activity')
 @login_required
 @admin_required
 def user_activity_report():
     format_type = request.args.get("format")
+    try:
+        start, end = parse_report_range(request.args)
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "danger")
+        return redirect(url_for('user_activity_report'))
+
+    data = report_cache.rows('user-activity', start, end)
+
+    # CSV Export
+    if format_type == "csv":
+        return report_csv_response('user-activity', data, "user_activity_report.csv")
+
+    return render_template("admin/reports/user_activity_report.html", data=data, start=start, end=end)
+
+@app.route('/admin/reports/utilization')
+@login_required
+@admin_required
+def utilization_report_view():
+    format_type = request.args.get("format")
+    try:
+        start, end = parse_report_range(request.args, default_days=30)
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "danger")
+        return redirect(url_for('utilization_report_view'))
 
-    data = db.session.query(
-        User.name,
-        User.email,
-        User.phone,
-        db.func.count(RentalOrder.id).label("orders"),
-        db.func.sum(RentalOrder.total_price).label("revenue"),
-        db.func.avg(RentalOrder.total_price).label("avg_revenue"),
-        db.func.sum(RentalOrder.total_days).label("total_days"),
-        db.func.avg(RentalOrder.total_days).label("avg_days"),
-        db.func.max(RentalOrder.created_at).label("last_order")
-    ).join(RentalOrder) \
-     .filter(RentalOrder.payment_status == "paid") \
-     .group_by(User.id) \
-     .order_by(db.desc("orders")) \
-     .all()
+    report = utilization_report(start, end)
 
     # CSV Export
     if format_type == "csv":
-        si = io.StringIO()
-        writer = csv.writer(si)
+        return report_csv_response('utilization', report['gadgets'], f"utilization_report_{start}_{end}.csv")
 
-        writer.writerow([
-            "User", "Email", "Phone",
-            "Total Orders", "Total Revenue (₹)", "Avg Revenue (₹)",
-            "Total Rental Days", "Avg Days",
-            "Last Order Date"
-        ])
+    return render_template("admin/reports/utilization_report.html", report=report, start=start, end=end)
+
+@app.route('/admin/report-exports', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_report_exports():
+    if request.method == 'POST':
+        report = request.form.get('report')
+        fmt = request.form.get('format', 'csv')
+        if report not in REPORTS or fmt not in EXPORT_FORMATS:
+            flash("Unknown report or format.", "danger")
+            return redirect(url_for('admin_report_exports'))
+        try:
+            start, end = parse_report_range(request.form)
+        except ValueError:
+            flash("Dates must be in YYYY-MM-DD format.", "danger")
+            return redirect(url_for('admin_report_exports'))
 
-        for row in data:
-            last_order = row.last_order.strftime("%Y-%m-%d") if row.last_order else ""
+        queue_report_export(report, fmt, start, end, user_id=current_user.id)
+        db.session.commit()
+        flash(f"{REPORTS[report][0]} export queued. It will be ready to download here shortly.", "success")
+        return redirect(url_for('admin_report_exports'))
 
-            writer.writerow([
-                row.name,
-                row.email,
-                row.phone or "",
-                row.orders,
-                f"{row.revenue:.2f}" if row.revenue else "0.00",
-                f"{row.avg_revenue:.2f}" if row.avg_revenue else "0.00",
-                row.total_days or 0,
-                f"{row.avg_days:.2f}" if row.avg_days else "0.00",
-                last_order
-            ])
+    exports = ReportExport.query.order_by(ReportExport.created_at.desc()).limit(50).all()
+    return render_template('admin/admin_report_exports.html', exports=exports, reports=REPORTS,
+                           formats=EXPORT_FORMATS)
 
-        output = make_response(si.getvalue())
-        output.headers["Content-Disposition"] = "attachment; filename=user_activity_report.csv"
-        output.headers["Content-type"] = "text/csv"
-        return output
+@app.route('/admin/report-exports/<int:export_id>/status')
+@login_required
+@admin_required
+def report_export_status(export_id):
+    export = ReportExport.query.get_or_404(export_id)
+    return jsonify({'id': export.id, 'status': export.status, 'rows_total': export.rows_total,
+                    'rows_written': export.rows_written, 'size_bytes': export.size_bytes, 'error': export.error})
 
-    return render_template("admin/reports/user_activity_report.html", data=data)
+@app.route('/admin/report-exports/<int:export_id>/download')
+@login_required
+@admin_required
+def download_report_export(export_id):
+    export = ReportExport.query.get_or_404(export_id)
+    if export.status != 'done' or not export.path or not os.path.exists(export.path):
+        abort(404)
+    # conditional=True answers Range / If-Range requests with 206 partial content
+    return send_file(export.path, mimetype='application/gzip', as_attachment=True,
+                     download_name=export_filename(export), conditional=True)
 
 
 
@@ -1323,8 +1268,37 @@ def admin_resolve_feedback(feedback_id):
 @login_required
 @admin_required
 def admin_users():
-    users = User.query.filter_by(is_admin=False).order_by(User.created_at.desc()).all()
-    return render_template('admin/admin_users.html', users=users)
+    sort_by = request.args.get('sort_by', 'newest')
+    min_trust = request.args.get('min_trust', type=int)
+    max_trust = request.args.get('max_trust', type=int)
+
+    users_query = User.query.filter_by(is_admin=False)
+    if min_trust is not None:
+        users_query = users_query.filter(User.trust_score >= min_trust)
+    if max_trust is not None:
+        users_query = users_query.filter(User.trust_score <= max_trust)
+
+    if sort_by == 'trust_high_low':
+        users_query = users_query.order_by(User.trust_score.desc())
+    elif sort_by == 'trust_low_high':
+        users_query = users_query.order_by(User.trust_score.asc())
+    else:
+        users_query = users_query.order_by(User.created_at.desc())
+
+    users = users_query.all()
+    summaries = user_order_summaries([user.id for user in users])
+    return render_template('admin/admin_users.html', users=users, sort_by=sort_by,
+                           min_trust=min_trust, max_trust=max_trust,
+                           summaries=summaries, empty_summary=empty_order_summary())
+
+@app.route('/admin/users/recompute-trust', methods=['POST'])
+@login_required
+@admin_required
+def admin_recompute_trust():
+    enqueue('recompute_trust_scores', max_attempts=1)
+    db.session.commit()
+    flash('Trust score recompute queued. Scores will refresh shortly.', 'info')
+    return redirect(url_for('admin_users'))
 
 
 @app.route('/admin/user/<int:user_id>/mark-verified')
@@ -1358,8 +1332,14 @@ def admin_deactivate_user(user_id):
 @admin_required
 def admin_user_rental_history(user_id):
     user = User.query.get_or_404(user_id)
-    user_orders = RentalOrder.query.filter_by(user_id=user.id).order_by(RentalOrder.created_at.desc()).all()
-    return render_template('admin/admin_user_rental_history.html', user=user, orders=user_orders)
+    summary = user_order_summaries([user.id]).get(user.id, empty_order_summary())
+    history = order_history()
+    orders = db.session.query(history).options(db.joinedload(history.gadget)) \
+                              .filter(history.user_id == user.id).order_by(history.created_at.desc()) \
+                              .paginate(page=request.args.get('page', 1, type=int), per_page=50,
+                                        error_out=False, count=False)
+    orders.total = summary['orders']  # already counted by the summary query
+    return render_template('admin/admin_user_rental_history.html', user=user, orders=orders, summary=summary)
 
 @app.route('/admin/gadgets')
 @login_required
@@ -1368,13 +1348,30 @@ def admin_gadgets():
     all_gadgets = Gadget.query.order_by(Gadget.created_at.desc()).all()
     return render_template('admin/admin_gadgets.html', gadgets=all_gadgets)
 
-@app.before_request
-def ensure_images_valid():
-    for g in Gadget.query.all():
-        img_path = os.path.join(app.root_path, "static", g.image or "default_gadget.png")
-        if not os.path.exists(img_path):
-            g.image = "default_gadget.png"
-    db.session.commit()
+@app.route('/admin/jobs')
+@login_required
+@admin_required
+def admin_jobs():
+    return render_template('admin/admin_jobs.html', jobs=job_stats(), now=datetime.utcnow())
+
+@app.route('/admin/metrics')
+@login_required
+@admin_required
+def admin_metrics():
+    # Per-process figures; each gunicorn worker reports its own
+    return jsonify({'fragment_cache': fragment_cache.stats(), 'search_cache': search_cache.stats(),
+                    'report_cache': report_cache.stats(), 'notifications': notification_stats()})
+
+@app.route('/admin/inventory/reconcile', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_reconcile_stock():
+    fix = request.method == 'POST'
+    drift = reconcile_stock(fix=fix)
+    if fix:
+        flash(f"Stock corrected from the ledger for {len(drift)} gadget(s).", "success")
+        return redirect(url_for('admin_reconcile_stock'))
+    return render_template('admin/admin_stock_reconcile.html', drift=drift)
 
 @app.route('/admin/gadgets/add', methods=['GET', 'POST'])
 @login_required
@@ -1397,9 +1394,7 @@ def admin_add_gadget():
 
         # If uploaded image exists → save it
         if image_file and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            image_file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            image_path = f"uploads/{filename}"
+            image_path = store_upload(image_file)
 
         # Create gadget
         new_gadget = Gadget(
@@ -1407,11 +1402,16 @@ def admin_add_gadget():
             category=category,
             description=description,
             price_per_day=price_per_day,
-            stock=stock,
+            stock=0,  # opening balance goes through the ledger below
             image=image_path
         )
 
         db.session.add(new_gadget)
+        db.session.flush()
+        suggest_index.upsert(new_gadget)
+        record_movements([(new_gadget.id, stock, 'opening', None)])
+        if image_path != "default_gadget.png":
+            enqueue('generate_image_variants', gadget_id=new_gadget.id)
         db.session.commit()
 
         flash(f"Gadget {name} added successfully!", "success")
@@ -1437,28 +1437,31 @@ def admin_edit_gadget(gadget_id):
         gadget.category = request.form.get('category')
         gadget.description = request.form.get('description')
         gadget.price_per_day = request.form.get('price_per_day', type=float)
-        gadget.stock = request.form.get('stock', type=int)
+        new_stock = request.form.get('stock', type=int)
+        if new_stock is not None and new_stock != gadget.stock:
+            record_movements([(gadget.id, new_stock - (gadget.stock or 0), 'adjust', None)])
         gadget.is_active = ('is_active' in request.form)
+        touch_gadget_card(gadget)
 
         image_file = request.files.get('image')
+        old_image = gadget.image
+        old_variants = None
 
         # Upload new image
         if image_file and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            image_file.save(save_path)
-
-            new_path = f"uploads/{filename}"
-
-            # Delete old image (only if not default)
-            if gadget.image != "default_gadget.png":
-                old_pathh = os.path.join(app.root_path, "static", gadget.image)
-                if os.path.exists(old_pathh):
-                    os.remove(old_pathh)
-
-            gadget.image = new_path
+            new_path = store_upload(image_file)
+            if new_path != old_image:
+                old_variants = forget_image_variants(gadget)
+                gadget.image = new_path
+                enqueue('generate_image_variants', gadget_id=gadget.id)
 
         db.session.commit()
+        # Files and the in-process suggest index only change once the edit is saved
+        suggest_index.upsert(gadget)
+        # Old upload is deleted only if no other gadget uses the same file
+        if gadget.image != old_image:
+            delete_image_variants(old_variants)
+            release_upload(old_image)
         flash("Gadget updated successfully.", "success")
         return redirect(url_for("admin_gadgets"))
 
@@ -1470,6 +1473,7 @@ def admin_edit_gadget(gadget_id):
 def admin_toggle_featured(gadget_id):
     gadget = Gadget.query.get_or_404(gadget_id)
     gadget.is_featured = not gadget.is_featured
+    touch_gadget_card(gadget)
     db.session.commit()
 
     msg = "added to Featured" if gadget.is_featured else "removed from Featured"
@@ -1483,20 +1487,68 @@ def admin_toggle_featured(gadget_id):
 @admin_required
 def admin_delete_gadget(gadget_id):
     gadget = Gadget.query.get_or_404(gadget_id)
-    # Delete associated image file
-    if gadget.image and gadget.image != "default_gadget.png":
-        try:
-            image_path = os.path.join(app.root_path, "static", gadget.image)
-            if os.path.exists(image_path):
-                os.remove(image_path)
-        except Exception as e:
-            app.logger.error(f"Error deleting gadget image: {e}")
+    image = gadget.image
+    variants = forget_image_variants(gadget)
+    touch_gadget_card(gadget)
 
     db.session.delete(gadget)
     db.session.commit()
+    suggest_index.remove(gadget.id)
+    # Delete the image files unless another gadget still references them
+    try:
+        delete_image_variants(variants)
+        release_upload(image)
+    except Exception as e:
+        app.logger.error(f"Error deleting gadget image: {e}")
     flash(f'Gadget {gadget.name} deleted successfully.', 'info')
     return redirect(url_for('admin_gadgets'))
 
 
+# --- Background jobs ---
+register_task('release_expired_holds', release_expired_holds)
+register_task('take_stock_snapshots', take_stock_snapshots)
+register_task('send_cart_reminders', send_cart_reminders)
+register_task('send_cart_reminder_emails', send_cart_reminder_emails)
+register_task('prune_job_history', prune_job_history)
+register_task('sweep_overdue_orders', sweep_overdue_orders)
+register_task('recompute_trust_scores', recompute_trust_scores)
+register_task('generate_image_variants', generate_image_variants)
+register_task('backfill_image_variants', backfill_image_variants)
+register_task('reset_missing_images', reset_missing_images)
+register_task('flush_gadget_views', flush_gadget_views)  # no longer recurring; kept for jobs already in the table
+register_task('recompute_trending_scores', recompute_trending_scores)
+register_task('rebuild_recommendations', rebuild_recommendations)
+register_task('generate_report_export', generate_report_export)
+register_task('prune_report_exports', prune_report_exports)
+register_task('archive_closed_orders', archive_closed_orders)
+register_task('compact_notifications', compact_notifications)
+register_task('scheduled_backup', scheduled_backup)
+
+RECURRING_JOBS = {
+    # name: (task, interval in seconds)
+    'cart-hold-sweep': ('release_expired_holds', 60),
+    'stock-snapshots': ('take_stock_snapshots', 3600),
+    'cart-reminders': ('send_cart_reminders', 3600),
+    'job-history-cleanup': ('prune_job_history', 24 * 3600),
+    'overdue-sweep': ('sweep_overdue_orders', 3600),
+    'image-variant-backfill': ('backfill_image_variants', 24 * 3600),
+    'missing-image-check': ('reset_missing_images', 3600),
+    'trending-recompute': ('recompute_trending_scores', 24 * 3600),
+    'recommendations-rebuild': ('rebuild_recommendations', 24 * 3600),
+    'report-export-cleanup': ('prune_report_exports', 24 * 3600),
+    'order-archival': ('archive_closed_orders', 24 * 3600),
+    'notification-retention': ('compact_notifications', 3600),
+    'database-backup': ('scheduled_backup', 24 * 3600),
+}
+
+# Only server processes run background jobs: a script such as seed_data.py
+# could otherwise claim a job and exit, leaving it leased to nobody.
+if app.config['RUN_SCHEDULER']:
+    start_scheduler(app, recurring=RECURRING_JOBS)
+
+
 if __name__ == '__main__':
+    # debug=True runs this file twice; only the reloader's serving child starts jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' and not app.config['RUN_SCHEDULER']:
+        start_scheduler(app, recurring=RECURRING_JOBS)
     app.run(debug=True)
@@ -0,0 +1,283 @@
+# backup.py
+# Online backups of the SQLite database.
+#
+# Copying gadget.db while the app writes to it can produce a torn file, so
+# backups go through SQLite's backup API instead: BACKUP_PAGES_PER_STEP pages
+# are copied under a shared lock, then the lock is released and the copy
+# pauses for BACKUP_STEP_PAUSE seconds so waiting writers can commit. If
+# another connection writes mid-copy SQLite restarts the backup from page 0;
+# after BACKUP_MAX_RESTARTS restarts the copy falls back to a single step,
+# which holds the read lock for the whole copy but always finishes.
+#
+# Snapshots are a backup gzipped with a "<sha256>  <name>" sidecar (the
+# sha256sum format). Restoring verifies the checksum and the database before
+# copying it over the live file through the same API.
+#
+#   python backup.py backup               # what the daily job does
+#   python backup.py export [PATH]        # compressed, checksummed snapshot
+#   python backup.py restore PATH         # replace the live database
+#   python backup.py bench [URL]          # request latency with/without a backup running
+
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+
+from extensions import db
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def database_path():
+    return db.engine.url.database
+
+
+def backup_folder():
+    folder = current_app.config['BACKUP_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _backup_name(suffix):
+    stem = os.path.splitext(os.path.basename(database_path()))[0]
+    return f"{stem}-{datetime.utcnow():%Y%m%d-%H%M%S}{suffix}"
+
+
+def _check_database(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise ValueError(f"{path} failed integrity check: {result}")
+
+
+def _copy(source, target, pages, pause, max_restarts):
+    """Backup-API copy of `source` into `target`; returns (steps, restarts)."""
+    steps = restarts = 0
+    remaining_before = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, remaining_before
+        steps += 1
+        if remaining_before is not None and remaining > remaining_before:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts()
+        remaining_before = remaining
+        if remaining and pause:
+            time.sleep(pause)
+
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    except _TooManyRestarts:
+        source.backup(target, pages=-1)
+    return steps, restarts
+
+
+def backup_database(dest=None, pages=None):
+    """Copy the live database to `dest` (default: a new file in BACKUP_FOLDER) without stopping writers."""
+    config = current_app.config
+    pages = pages or config.get('BACKUP_PAGES_PER_STEP', 256)
+    dest = dest or os.path.join(backup_folder(), _backup_name('.db'))
+    started = time.perf_counter()
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)), suffix='.part')
+    os.close(fd)
+    source = sqlite3.connect(f"file:{database_path()}?mode=ro", uri=True)
+    target = sqlite3.connect(tmp_path)
+    try:
+        steps, restarts = _copy(source, target, pages, config.get('BACKUP_STEP_PAUSE', 0.005),
+                                config.get('BACKUP_MAX_RESTARTS', 3))
+        target.close()
+        _check_database(tmp_path)
+        os.replace(tmp_path, dest)
+    finally:
+        source.close()
+        target.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    stats = {'path': dest, 'bytes': os.path.getsize(dest), 'steps': steps, 'restarts': restarts,
+             'seconds': round(time.perf_counter() - started, 3)}
+    current_app.logger.info(f"Database backup: {stats}")
+    return stats
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_snapshot(dest=None):
+    """Backup, gzip and checksum; returns the backup stats plus the snapshot path and sha256."""
+    dest = dest or os.path.join(backup_folder(), _backup_name('.db.gz'))
+    folder = os.path.dirname(os.path.abspath(dest))
+    fd, raw_path = tempfile.mkstemp(dir=folder, suffix='.db')
+    os.close(fd)
+    fd, gz_path = tempfile.mkstemp(dir=folder, suffix='.gz.part')
+    os.close(fd)
+    try:
+        stats = backup_database(raw_path)
+        with open(raw_path, 'rb') as raw, gzip.open(gz_path, 'wb', compresslevel=6) as gz:
+            shutil.copyfileobj(raw, gz, 1 << 20)
+        checksum = _sha256(gz_path)
+        os.replace(gz_path, dest)
+    finally:
+        for path in (raw_path, gz_path):
+            if os.path.exists(path):
+                os.remove(path)
+    with open(dest + '.sha256', 'w') as f:
+        f.write(f"{checksum}  {os.path.basename(dest)}\n")
+
+    stats.update(path=dest, bytes=os.path.getsize(dest), sha256=checksum)
+    return stats
+
+
+def _table_versions(conn):
+    try:
+        return dict(conn.execute('SELECT name, version FROM table_version'))
+    except sqlite3.OperationalError:
+        return {}
+
+
+def _advance_table_versions(conn, live):
+    """Set every version in `conn` above both its own and the live database's value."""
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+    restored = _table_versions(conn)
+    with conn:
+        conn.executemany(
+            'INSERT INTO table_version (name, version, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at',
+            [(name, max(live.get(name, 0), restored.get(name, 0)) + 1, now)
+             for name in sorted(live.keys() | restored.keys())]
+        )
+
+
+def restore_snapshot(path):
+    """
+    Replace the live database with a snapshot (.db.gz with its .sha256, or a plain .db backup).
+
+    The copy into the live file takes SQLite's write lock for its duration,
+    so requests wait rather than see a half-restored database; pooled
+    connections are dropped afterwards. Table versions in the snapshot are
+    moved past the live ones first, so caches and ETags that running workers
+    built from pre-restore data can never match the restored data.
+    """
+    if path.endswith('.gz'):
+        with open(path + '.sha256') as f:
+            expected = f.read().split()[0]
+        if _sha256(path) != expected:
+            raise ValueError(f"{path} does not match its checksum")
+
+    fd, raw_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(database_path())), suffix='.restore')
+    os.close(fd)
+    try:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as src, open(raw_path, 'wb') as out:
+            shutil.copyfileobj(src, out, 1 << 20)
+        _check_database(raw_path)
+
+        db.session.remove()
+        db.engine.dispose()
+        source = sqlite3.connect(raw_path)
+        target = sqlite3.connect(database_path(), timeout=30)
+        try:
+            _advance_table_versions(source, _table_versions(target))
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+    finally:
+        os.remove(raw_path)
+    current_app.logger.info(f"Database restored from {path}")
+
+
+def prune_backups(keep=None):
+    """Keep the newest `keep` backups and snapshots of each kind; returns how many were removed."""
+    keep = keep or current_app.config.get('BACKUP_KEEP', 7)
+    folder = backup_folder()
+    prefix = os.path.splitext(os.path.basename(database_path()))[0] + '-'
+    removed = 0
+    for suffix in ('.db', '.db.gz'):
+        names = sorted(name for name in os.listdir(folder) if name.startswith(prefix) and name.endswith(suffix))
+        for name in names[:-keep]:
+            for stale in (name, name + '.sha256'):
+                if os.path.exists(os.path.join(folder, stale)):
+                    os.remove(os.path.join(folder, stale))
+            removed += 1
+    return removed
+
+
+def scheduled_backup():
+    stats = backup_database()
+    stats['pruned'] = prune_backups()
+    return stats
+
+
+def benchmark_backup_latency(client, url, requests=200):
+    """Latencies (ms) of `url` with no backup running and then while one is."""
+    def sample(count):
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        return np.array(timings)
+
+    def summary(timings):
+        return {'requests': int(timings.size), 'p50_ms': round(float(np.percentile(timings, 50)), 2),
+                'p95_ms': round(float(np.percentile(timings, 95)), 2), 'max_ms': round(float(timings.max()), 2)}
+
+    app = current_app._get_current_object()
+    baseline = sample(requests)
+    result = {}
+
+    def run_backup():
+        with app.app_context():
+            result.update(backup_database(os.path.join(backup_folder(), 'bench.db')))
+
+    worker = threading.Thread(target=run_backup)
+    worker.start()
+    during = []
+    while worker.is_alive():
+        during.extend(sample(10).tolist())
+    worker.join()
+    os.remove(os.path.join(backup_folder(), 'bench.db'))
+    return {'baseline': summary(baseline), 'during_backup': summary(np.array(during or [0.0])),
+            'backup': result}
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+
+    from app import app
+
+    command, args = (sys.argv[1] if len(sys.argv) > 1 else 'backup'), sys.argv[2:]
+    with app.app_context():
+        if command == 'backup':
+            print(json.dumps(scheduled_backup(), indent=2))
+        elif command == 'export':
+            print(json.dumps(export_snapshot(*args[:1]), indent=2))
+        elif command == 'restore' and args:
+            restore_snapshot(args[0])
+            print(f"Restored {args[0]}")
+        elif command == 'bench':
+            print(json.dumps(benchmark_backup_latency(app.test_client(), args[0] if args else '/gadgets'), indent=2))
+        else:
+            sys.exit("usage: python backup.py [backup | export [PATH] | restore PATH | bench [URL]]")
@@ -72,3 +72,17 @@ def send_deposit_refund_confirmation_email(email, user_name, order_id, refund_am
 
     safe_print(f"Sending Deposit Refund Email to: {email}")
     safe_print(f"Body:\n{body}")
+
+
+def send_cart_reminder_email(email, user_name, item_count):
+    subject = "You left something in your cart"
+
+    body = (
+        f"Dear {user_name},\n\n"
+        f"You still have {item_count} item(s) waiting in your Gadget Rental cart.\n"
+        "Complete your order before someone else rents them!\n\n"
+        "Best regards,\nThe Gadget Rental Team"
+    )
+
+    safe_print(f"Sending Cart Reminder Email to: {email}")
+    safe_print(f"Body:\n{body}")
@@ -0,0 +1,186 @@
+# images.py
+# Responsive image variants for gadget photos.
+#
+# Uploaded originals are resized in the background into thumb/card/detail
+# widths, each as WebP plus a JPEG/PNG fallback, under content-hash file
+# names so they can be cached forever. Templates render them with
+# gadget_picture(), which emits <picture>/srcset markup.
+
+import hashlib
+import json
+import os
+
+from flask import current_app, url_for
+from markupsafe import Markup, escape
+from PIL import Image, ImageOps
+
+from extensions import db
+from models import Gadget
+
+
+VARIANT_WIDTHS = {'thumb': 160, 'card': 480, 'detail': 960}
+VARIANT_DIR = 'uploads/variants'   # relative to /static
+
+DEFAULT_SIZES = {
+    'thumb': '80px',
+    'card': '(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw',
+    'detail': '(min-width: 768px) 50vw, 100vw',
+}
+
+
+def content_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_variants(original_path):
+    """
+    Write every variant of one original image and return its manifest:
+    {"hash": ..., "variants": {name: {"width", "webp", "fallback"}}}.
+    Existing files are reused, since the name already identifies the content.
+    """
+    static_dir = os.path.join(current_app.root_path, 'static')
+    out_dir = os.path.join(static_dir, VARIANT_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    digest = content_hash(original_path)[:16]
+    manifest = {'hash': digest, 'variants': {}}
+
+    with Image.open(original_path) as im:
+        im = ImageOps.exif_transpose(im)  # also takes the first frame of animations
+        has_alpha = im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info)
+        im = im.convert('RGBA' if has_alpha else 'RGB')
+        fallback_ext, fallback_format = ('png', 'PNG') if has_alpha else ('jpg', 'JPEG')
+
+        for name, width in VARIANT_WIDTHS.items():
+            width = min(width, im.width)  # never upscale
+            height = max(1, round(im.height * width / im.width))
+            webp_rel = f"{VARIANT_DIR}/{digest}-{width}.webp"
+            fallback_rel = f"{VARIANT_DIR}/{digest}-{width}.{fallback_ext}"
+
+            if not (os.path.exists(os.path.join(static_dir, webp_rel))
+                    and os.path.exists(os.path.join(static_dir, fallback_rel))):
+                resized = im.resize((width, height), Image.LANCZOS)
+                resized.save(os.path.join(static_dir, webp_rel), 'WEBP', quality=80, method=6)
+                if fallback_format == 'JPEG':
+                    resized.save(os.path.join(static_dir, fallback_rel), 'JPEG', quality=82,
+                                 optimize=True, progressive=True)
+                else:
+                    resized.save(os.path.join(static_dir, fallback_rel), 'PNG', optimize=True)
+
+            manifest['variants'][name] = {'width': width, 'height': height,
+                                          'webp': webp_rel, 'fallback': fallback_rel}
+    return manifest
+
+
+def generate_image_variants(gadget_id):
+    """Background task: build variants for a gadget's current image."""
+    gadget = db.session.get(Gadget, gadget_id)
+    if not gadget or not gadget.image or not gadget.image.startswith('uploads/'):
+        return
+    original_path = os.path.join(current_app.root_path, 'static', gadget.image)
+    if not os.path.exists(original_path):
+        return
+
+    image = gadget.image
+    manifest = build_variants(original_path)
+    # Only attach the variants if the image was not replaced meanwhile
+    Gadget.query.filter_by(id=gadget_id, image=image) \
+                .update({Gadget.image_variants: json.dumps(manifest),
+                         Gadget.card_version: Gadget.card_version + 1}, synchronize_session=False)
+    db.session.commit()
+
+
+def backfill_image_variants():
+    """
+    Build variants for uploaded images that do not have any yet. An image
+    that cannot be processed is logged and skipped; it is retried next run.
+    """
+    missing = Gadget.query.with_entities(Gadget.id) \
+                          .filter(Gadget.image.like('uploads/%'), Gadget.image_variants.is_(None)).all()
+    failed = 0
+    for (gadget_id,) in missing:
+        try:
+            generate_image_variants(gadget_id)
+        except Exception as e:
+            db.session.rollback()
+            failed += 1
+            current_app.logger.warning(f"Image variants for gadget #{gadget_id} failed: {type(e).__name__}: {e}")
+    return {'gadgets': len(missing), 'failed': failed}
+
+
+def reset_missing_images():
+    """Point gadgets whose image file is gone back at the default image."""
+    static_dir = os.path.join(current_app.root_path, 'static')
+    missing = [gadget_id for gadget_id, image in Gadget.query.with_entities(Gadget.id, Gadget.image)
+               if image and not os.path.exists(os.path.join(static_dir, image))]
+    if missing:
+        Gadget.query.filter(Gadget.id.in_(missing)) \
+                    .update({Gadget.image: 'default_gadget.png', Gadget.image_variants: None,
+                             Gadget.card_version: Gadget.card_version + 1}, synchronize_session=False)
+        db.session.commit()
+    return len(missing)
+
+
+def forget_image_variants(gadget):
+    """
+    Detach a gadget's variants and return their manifest. Pass it to
+    delete_image_variants() once the change is committed, so a rolled-back
+    edit never loses files its gadget still points at.
+    """
+    if not gadget.image_variants:
+        return None
+    manifest = json.loads(gadget.image_variants)
+    gadget.image_variants = None
+    return manifest
+
+
+def delete_image_variants(manifest):
+    """Delete the files of a forgotten manifest, unless a gadget still uses the same image content."""
+    if not manifest:
+        return
+    if Gadget.query.filter(Gadget.image_variants.like(f'%"{manifest["hash"]}"%')).count():
+        return
+    static_dir = os.path.join(current_app.root_path, 'static')
+    for v in manifest['variants'].values():
+        for path in (v['webp'], v['fallback']):
+            try:
+                os.remove(os.path.join(static_dir, path))
+            except FileNotFoundError:
+                pass
+
+
+def gadget_picture(gadget, variant='card', class_='', sizes=None, lazy=True):
+    """
+    <picture> markup for a gadget image. Falls back to the original upload
+    (or the default image) until the variants have been generated.
+    """
+    alt = escape(gadget.name or '')
+    loading = ' loading="lazy" decoding="async"' if lazy else ''
+
+    if not gadget.image_variants:
+        src = url_for('static', filename=gadget.image or 'default_gadget.png')
+        return Markup(f'<img src="{src}" alt="{alt}" class="{class_}"{loading}>')
+
+    manifest = json.loads(gadget.image_variants)['variants']
+    variants = sorted(manifest.values(), key=lambda v: v['width'])
+    chosen = manifest[variant]
+    sizes = sizes or DEFAULT_SIZES[variant]
+
+    def srcset(kind):
+        seen = {}
+        for v in variants:
+            seen.setdefault(v['width'], f"{url_for('static', filename=v[kind])} {v['width']}w")
+        return ', '.join(seen.values())
+
+    return Markup(
+        f'<picture class="contents">'
+        f'<source type="image/webp" srcset="{srcset("webp")}" sizes="{sizes}">'
+        f'<img src="{url_for("static", filename=chosen["fallback"])}" srcset="{srcset("fallback")}" '
+        f'sizes="{sizes}" width="{chosen["width"]}" height="{chosen["height"]}" '
+        f'alt="{alt}" class="{class_}"{loading}>'
+        f'</picture>'
+    )
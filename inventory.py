@@ -0,0 +1,253 @@
+# inventory.py
+# Stock ledger and cart reservation holds.
+#
+# Every stock change is an append-only StockMovement; Gadget.stock is the
+# running total kept in step with the ledger inside the same transaction.
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from extensions import db
+from models import Gadget, CartItem, StockMovement, StockSnapshot
+
+
+# --- Stock ledger ---
+
+def record_movements(movements):
+    """
+    Append (gadget_id, delta, reason, order_id) movements and apply their net
+    effect to Gadget.stock with one UPDATE.
+    """
+    movements = [m for m in movements if m[1]]
+    if not movements:
+        return
+    now = datetime.utcnow()
+    db.session.execute(db.insert(StockMovement), [
+        {'gadget_id': gadget_id, 'delta': delta, 'reason': reason,
+         'order_id': order_id, 'created_at': now}
+        for gadget_id, delta, reason, order_id in movements
+    ])
+
+    net = defaultdict(int)
+    for gadget_id, delta, _, _ in movements:
+        net[gadget_id] += delta
+    Gadget.query.filter(Gadget.id.in_(net)) \
+                .update({Gadget.stock: Gadget.stock + db.case(net, value=Gadget.id, else_=0)},
+                        synchronize_session=False)
+
+
+def open_stock_ledger():
+    """Record an opening balance for gadgets that have no ledger entries yet."""
+    has_movements = db.session.query(StockMovement.gadget_id).distinct()
+    unopened = Gadget.query.with_entities(Gadget.id, Gadget.stock) \
+                           .filter(Gadget.id.notin_(has_movements)).all()
+    now = datetime.utcnow()
+    if unopened:
+        db.session.execute(db.insert(StockMovement), [
+            {'gadget_id': gadget_id, 'delta': stock or 0, 'reason': 'opening', 'created_at': now}
+            for gadget_id, stock in unopened
+        ])
+    return len(unopened)
+
+
+def ledger_stock(gadget_id):
+    """Latest snapshot plus the short tail of movements recorded after it."""
+    snapshot = StockSnapshot.query.filter_by(gadget_id=gadget_id) \
+                                  .order_by(StockSnapshot.id.desc()).first()
+    base, upto = (snapshot.stock, snapshot.last_movement_id) if snapshot else (0, 0)
+    tail = db.session.query(db.func.sum(StockMovement.delta)) \
+                     .filter(StockMovement.gadget_id == gadget_id, StockMovement.id > upto) \
+                     .scalar()
+    return base + (tail or 0)
+
+
+def ledger_levels(upto=None):
+    """Stock of every gadget according to the ledger, computed in one query."""
+    latest = db.session.query(db.func.max(StockSnapshot.id)).group_by(StockSnapshot.gadget_id)
+    snap = db.session.query(StockSnapshot.gadget_id, StockSnapshot.stock, StockSnapshot.last_movement_id) \
+                     .filter(StockSnapshot.id.in_(latest)).subquery()
+    tail = db.session.query(StockMovement.gadget_id, db.func.sum(StockMovement.delta).label('delta'),
+                            db.func.count(StockMovement.id).label('movements')) \
+                     .outerjoin(snap, snap.c.gadget_id == StockMovement.gadget_id) \
+                     .filter(StockMovement.id > db.func.coalesce(snap.c.last_movement_id, 0))
+    if upto is not None:
+        tail = tail.filter(StockMovement.id <= upto)
+    tail = tail.group_by(StockMovement.gadget_id).subquery()
+
+    rows = db.session.query(
+        Gadget.id, Gadget.name, Gadget.stock,
+        (db.func.coalesce(snap.c.stock, 0) + db.func.coalesce(tail.c.delta, 0)).label('ledger_stock'),
+        db.func.coalesce(tail.c.movements, 0).label('new_movements')
+    ).outerjoin(snap, snap.c.gadget_id == Gadget.id) \
+     .outerjoin(tail, tail.c.gadget_id == Gadget.id) \
+     .all()
+    return rows
+
+
+def take_stock_snapshots():
+    """
+    Fold the ledger tail of every gadget into a new snapshot row. Gadgets with
+    no movements since their last snapshot are skipped, so the table only
+    grows with stock activity.
+    """
+    upto = db.session.query(db.func.max(StockMovement.id)).scalar()
+    if upto is None:
+        return 0
+    now = datetime.utcnow()
+    changed = [row for row in ledger_levels(upto=upto) if row.new_movements]
+    if changed:
+        db.session.execute(db.insert(StockSnapshot), [
+            {'gadget_id': row.id, 'stock': row.ledger_stock, 'last_movement_id': upto, 'created_at': now}
+            for row in changed
+        ])
+    db.session.commit()
+    return len(changed)
+
+
+def reconcile_stock(fix=False):
+    """
+    Recompute stock from the ledger for all gadgets and report where
+    Gadget.stock has drifted. With fix=True the ledger value is written back.
+    """
+    drift = [
+        {'gadget_id': row.id, 'name': row.name, 'stock': row.stock or 0,
+         'ledger_stock': row.ledger_stock, 'drift': (row.stock or 0) - row.ledger_stock}
+        for row in ledger_levels() if (row.stock or 0) != row.ledger_stock
+    ]
+    if fix and drift:
+        corrected = {d['gadget_id']: d['ledger_stock'] for d in drift}
+        Gadget.query.filter(Gadget.id.in_(corrected)) \
+                    .update({Gadget.stock: db.case(corrected, value=Gadget.id)}, synchronize_session=False)
+        db.session.commit()
+    return drift
+
+
+# --- Cart holds ---
+# Holds only change held_count, which the catalog pages never show, so the
+# hold UPDATEs don't bump the gadget table's version (that would invalidate
+# every catalog ETag and cached card on each cart change). The detail page,
+# which shows free units, validates on availability_key() instead.
+
+def hold_expiry(now=None):
+    minutes = current_app.config.get('CART_HOLD_MINUTES', 15)
+    return (now or datetime.utcnow()) + timedelta(minutes=minutes)
+
+
+def available_stock(gadget):
+    """Units that are neither rented out nor held in someone's cart."""
+    return (gadget.stock or 0) - (gadget.held_count or 0)
+
+
+def availability_key(gadget_id):
+    """(stock, held_count) of one gadget, for the detail page's ETag."""
+    return tuple(db.session.query(Gadget.stock, Gadget.held_count).filter(Gadget.id == gadget_id).first() or ())
+
+
+def reserve_units(gadget_id, quantity):
+    """
+    Atomically add `quantity` to the gadget's held count if enough free stock
+    remains. Returns False (and reserves nothing) otherwise.
+    """
+    if quantity <= 0:
+        return True
+    rows = Gadget.query.filter(Gadget.id == gadget_id, Gadget.stock - Gadget.held_count >= quantity) \
+                       .execution_options(bump_versions=False) \
+                       .update({Gadget.held_count: Gadget.held_count + quantity}, synchronize_session=False)
+    return rows == 1
+
+
+def release_units(gadget_id, quantity):
+    if quantity <= 0:
+        return
+    Gadget.query.filter_by(id=gadget_id) \
+                .execution_options(bump_versions=False) \
+                .update({Gadget.held_count: Gadget.held_count - quantity}, synchronize_session=False)
+
+
+def hold_cart_item(item, extra_quantity):
+    """
+    Grow a cart item by `extra_quantity` and (re)acquire its hold.
+    An item whose hold already lapsed has to reserve its whole quantity again.
+    Returns False if the units are not available; the item is left unchanged.
+    """
+    needed = extra_quantity if item.hold_expires_at else (item.quantity or 0) + extra_quantity
+    if not reserve_units(item.gadget_id, needed):
+        return False
+    item.quantity = (item.quantity or 0) + extra_quantity
+    item.hold_expires_at = hold_expiry()
+    return True
+
+
+def set_cart_item_quantity(item, quantity):
+    """Change an item's quantity, adjusting its hold by the difference only."""
+    if item.hold_expires_at:
+        delta = quantity - item.quantity
+        if delta > 0 and not reserve_units(item.gadget_id, delta):
+            return False
+        release_units(item.gadget_id, -delta)
+    elif not reserve_units(item.gadget_id, quantity):
+        return False
+    item.quantity = quantity
+    item.hold_expires_at = hold_expiry()
+    return True
+
+
+def release_cart_item(item):
+    if item.hold_expires_at:
+        release_units(item.gadget_id, item.quantity or 0)
+        item.hold_expires_at = None
+
+
+def release_user_holds(user_id):
+    """Drop every live hold of a user with one UPDATE per gadget in their cart."""
+    held = db.session.query(CartItem.gadget_id, db.func.sum(CartItem.quantity)) \
+                     .filter(CartItem.user_id == user_id, CartItem.hold_expires_at.isnot(None)) \
+                     .group_by(CartItem.gadget_id).all()
+    for gadget_id, quantity in held:
+        release_units(gadget_id, quantity or 0)
+    CartItem.query.filter(CartItem.user_id == user_id, CartItem.hold_expires_at.isnot(None)) \
+                  .update({CartItem.hold_expires_at: None, CartItem.updated_at: CartItem.updated_at},
+                          synchronize_session=False)
+
+
+def renew_user_holds(user_id):
+    """
+    Extend the user's live holds (any cart activity counts) and try to re-acquire
+    holds that the sweeper already released. Hold bookkeeping leaves
+    updated_at alone: it is the "abandoned since" clock of cart reminders.
+    """
+    expires = hold_expiry()
+    CartItem.query.filter(CartItem.user_id == user_id, CartItem.hold_expires_at.isnot(None)) \
+                  .update({CartItem.hold_expires_at: expires, CartItem.updated_at: CartItem.updated_at},
+                          synchronize_session=False)
+    lapsed = CartItem.query.filter_by(user_id=user_id, hold_expires_at=None).all()
+    reacquired = [item.id for item in lapsed if reserve_units(item.gadget_id, item.quantity or 0)]
+    if reacquired:
+        CartItem.query.filter(CartItem.id.in_(reacquired)) \
+                      .update({CartItem.hold_expires_at: expires, CartItem.updated_at: CartItem.updated_at},
+                              synchronize_session=False)
+
+
+def release_expired_holds(now=None):
+    """
+    Release every hold that expired before `now`. Uses the index on
+    hold_expires_at; both statements run in one transaction so concurrent
+    sweepers (one per gunicorn worker) cannot release the same hold twice.
+    """
+    now = now or datetime.utcnow()
+    expired = db.session.query(db.func.sum(CartItem.quantity)) \
+                        .filter(CartItem.gadget_id == Gadget.id,
+                                CartItem.hold_expires_at <= now) \
+                        .scalar_subquery()
+    expired_gadgets = db.session.query(CartItem.gadget_id).filter(CartItem.hold_expires_at <= now)
+
+    Gadget.query.filter(Gadget.id.in_(expired_gadgets.scalar_subquery())) \
+                .execution_options(bump_versions=False) \
+                .update({Gadget.held_count: Gadget.held_count - db.func.coalesce(expired, 0)},
+                        synchronize_session=False)
+    released = CartItem.query.filter(CartItem.hold_expires_at <= now) \
+                             .update({CartItem.hold_expires_at: None, CartItem.updated_at: CartItem.updated_at},
+                                     synchronize_session=False)
+    db.session.commit()
+    return released
@@ -16,26 +16,38 @@ class User(db.Model, UserMixin):
     is_verified = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    trust_score = db.Column(db.Integer, default=100)
+    trust_score = db.Column(db.Integer, default=100, index=True)
+    trust_points = db.Column(db.Integer, default=0)  # raw sum of trust event weights (see trust.py)
+    cart_reminded_at = db.Column(db.DateTime)  # last abandoned-cart reminder
 
     def __repr__(self):
         return f"User('{self.name}', '{self.email}')"
 
 
 class Gadget(db.Model):
+    # Catalog sorts ("popularity", "trending") are index scans over active gadgets
+    __table_args__ = (
+        db.Index('ix_gadget_active_trending', 'is_active', 'trending_score'),
+        db.Index('ix_gadget_active_rental_count', 'is_active', 'rental_count'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
     category = db.Column(db.String(50))
     description = db.Column(db.Text)
     price_per_day = db.Column(db.Float)
     stock = db.Column(db.Integer)
+    held_count = db.Column(db.Integer, default=0)  # units reserved by live cart holds
     # stores: relative path under /static, e.g. 'uploads/file.jpg' or 'default_gadget.png'
-    image = db.Column(db.String(200), default="default_gadget.png")
+    image = db.Column(db.String(200), default="default_gadget.png", index=True)  # indexed for upload ref counts
+    image_variants = db.Column(db.Text)  # JSON manifest written by images.generate_image_variants
     is_active = db.Column(db.Boolean, default=True)
     is_featured = db.Column(db.Boolean, default=False)
     view_count = db.Column(db.Integer, default=0)
     rental_count = db.Column(db.Integer, default=0)
+    trending_score = db.Column(db.Float, default=0.0)  # time-decayed rentals, see trending.py
     avg_rating = db.Column(db.Float, default=0.0)
+    card_version = db.Column(db.Integer, default=0)  # bumped when the catalog card markup changes
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
@@ -45,12 +57,17 @@ class Gadget(db.Model):
 
 
 class CartItem(db.Model):
+    # Covers the abandoned-cart scan: last activity per user without touching the table
+    __table_args__ = (db.Index('ix_cart_item_user_id_updated_at', 'user_id', 'updated_at'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     gadget_id = db.Column(db.Integer, db.ForeignKey('gadget.id'))
     quantity = db.Column(db.Integer, default=1)
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
+    hold_expires_at = db.Column(db.DateTime, index=True)  # NULL = no stock reserved
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = db.relationship('User', backref=db.backref('cart_items', lazy=True))
     gadget = db.relationship('Gadget', backref=db.backref('cart_items', lazy=True))
@@ -59,22 +76,48 @@ class CartItem(db.Model):
         return f"CartItem(User: {self.user_id}, Gadget: {self.gadget_id}, Quantity: {self.quantity})"
 
 
-class RentalOrder(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
+def _order_created_date(context):
+    created_at = context.get_current_parameters().get('created_at')
+    return (created_at or datetime.utcnow()).date()
+
+
+class RentalOrderColumns:
+    # Shared by the live table and the archive (see order_archive.py)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     gadget_id = db.Column(db.Integer, db.ForeignKey('gadget.id'))
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
+    quantity = db.Column(db.Integer, default=1)
     total_days = db.Column(db.Integer)
     total_price = db.Column(db.Float)
     security_deposit = db.Column(db.Float)
     deposit_returned = db.Column(db.Boolean, default=False)
     promo_code = db.Column(db.String(20))
     discount_amount = db.Column(db.Float, default=0.0)
-    status = db.Column(db.String(20))         # booked, approved, active, returned, cancelled
+    late_fee = db.Column(db.Float, default=0.0)
+    cancelled_by = db.Column(db.String(10))   # user, admin
+    status = db.Column(db.String(20))         # booked, approved, active, delivered, overdue, returned, cancelled
     payment_status = db.Column(db.String(20)) # pending, paid, failed
     transaction_id = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_date = db.Column(db.Date, default=_order_created_date)  # date part of created_at
+
+
+class RentalOrder(RentalOrderColumns, db.Model):
+    # Serves the overdue sweep (status IN (...) AND end_date < today); the
+    # trailing columns cover the utilization report's interval scan.
+    # Reports filter and group paid orders on created_date ranges. History
+    # pages read one user's orders newest first; the trailing columns cover
+    # the per-user summary query. AUTOINCREMENT keeps SQLite from reusing
+    # the ids of orders the archival job has moved out (see order_archive.py).
+    __table_args__ = (
+        db.Index('ix_rental_order_status_end_date', 'status', 'end_date', 'start_date', 'gadget_id', 'quantity'),
+        db.Index('ix_rental_order_payment_created_date', 'payment_status', 'created_date'),
+        db.Index('ix_rental_order_user_created_at', 'user_id', 'created_at', 'status', 'payment_status', 'total_price'),
+        {'sqlite_autoincrement': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
 
     user = db.relationship('User', backref=db.backref('orders', lazy=True))
     gadget = db.relationship('Gadget', backref=db.backref('orders', lazy=True))
@@ -83,16 +126,58 @@ class RentalOrder(db.Model):
         return f"RentalOrder(User: {self.user_id}, Gadget: {self.gadget_id}, Total: {self.total_price})"
 
 
+class ArchivedRentalOrder(RentalOrderColumns, db.Model):
+    # Closed orders moved out of rental_order by the archival job; ids are kept.
+    # Same report/history indexes as the live table, plus end_date for the
+    # utilization report's range check.
+    __table_args__ = (
+        db.Index('ix_archived_rental_order_status_end_date', 'status', 'end_date', 'start_date', 'gadget_id', 'quantity'),
+        db.Index('ix_archived_rental_order_payment_created_date', 'payment_status', 'created_date'),
+        db.Index('ix_archived_rental_order_user_created_at', 'user_id', 'created_at', 'status', 'payment_status', 'total_price'),
+        db.Index('ix_archived_rental_order_created_date', 'created_date'),
+        db.Index('ix_archived_rental_order_end_date', 'end_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User')
+    gadget = db.relationship('Gadget')
+
+    def __repr__(self):
+        return f"ArchivedRentalOrder({self.id}, User: {self.user_id}, Total: {self.total_price})"
+
+
+class OverdueRental(db.Model):
+    # Precomputed by the overdue sweep for the admin overdue dashboard
+    order_id = db.Column(db.Integer, db.ForeignKey('rental_order.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    gadget_id = db.Column(db.Integer, db.ForeignKey('gadget.id'))
+    user_name = db.Column(db.String(100))
+    user_email = db.Column(db.String(100))
+    gadget_name = db.Column(db.String(100))
+    end_date = db.Column(db.Date)
+    days_overdue = db.Column(db.Integer, index=True)
+    late_fee = db.Column(db.Float)
+    refreshed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"OverdueRental(Order: {self.order_id}, Days: {self.days_overdue}, Fee: {self.late_fee})"
+
+
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('rental_order.id'))
+    # Not a foreign key: the order may since have moved to ArchivedRentalOrder
+    # under the same id (see order_archive.find_order)
+    order_id = db.Column(db.Integer)
     gadget_id = db.Column(db.Integer, db.ForeignKey('gadget.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     rating = db.Column(db.Integer)  # 1–5
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    order = db.relationship('RentalOrder', backref=db.backref('reviews', lazy=True))
+    order = db.relationship('RentalOrder', primaryjoin='foreign(Review.order_id) == RentalOrder.id',
+                            backref=db.backref('reviews', lazy=True))
     gadget = db.relationship('Gadget', backref=db.backref('reviews', lazy=True))
     user = db.relationship('User', backref=db.backref('reviews', lazy=True))
 
@@ -114,11 +199,22 @@ class Wishlist(db.Model):
 
 
 class Notification(db.Model):
+    # A row with digest_count set stands in for that many read notifications
+    # from one day (created_at is the day's midnight); see compact_notifications.
+    # The partial unique index is the upsert target for digests.
+    __table_args__ = (
+        db.Index('ix_notification_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_notification_created_at', 'created_at'),
+        db.Index('ux_notification_digest', 'user_id', 'created_at', unique=True,
+                 sqlite_where=db.text('digest_count IS NOT NULL')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     message = db.Column(db.String(200))
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    digest_count = db.Column(db.Integer)
 
     user = db.relationship('User', backref=db.backref('notifications', lazy=True))
 
@@ -153,3 +249,121 @@ class Coupon(db.Model):
 
     def __repr__(self):
         return f"Coupon(code={self.code}, discount={self.discount_percent}%)"
+
+
+class StockMovement(db.Model):
+    # Append-only: rows are never updated or deleted
+    __table_args__ = (db.Index('ix_stock_movement_gadget_id_id', 'gadget_id', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    gadget_id = db.Column(db.Integer, db.ForeignKey('gadget.id'), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)   # +returned / -rented out
+    reason = db.Column(db.String(20))               # opening, checkout, cancel, reject, return, adjust
+    order_id = db.Column(db.Integer, nullable=True)  # live or archived order, so no foreign key
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"StockMovement(Gadget: {self.gadget_id}, Delta: {self.delta}, Reason: {self.reason})"
+
+
+class StockSnapshot(db.Model):
+    # Stock level of a gadget including every movement up to last_movement_id
+    __table_args__ = (db.Index('ix_stock_snapshot_gadget_id_id', 'gadget_id', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    gadget_id = db.Column(db.Integer, db.ForeignKey('gadget.id'), nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    last_movement_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"StockSnapshot(Gadget: {self.gadget_id}, Stock: {self.stock}, Upto: {self.last_movement_id})"
+
+
+class Job(db.Model):
+    # Background job: recurring when interval_seconds is set, one-off otherwise
+    __table_args__ = (db.Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=True)  # only recurring jobs are named
+    task = db.Column(db.String(100), nullable=False)
+    args = db.Column(db.Text, default='{}')                       # JSON keyword arguments
+    interval_seconds = db.Column(db.Integer, nullable=True)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow)
+    status = db.Column(db.String(20), default='scheduled')        # scheduled, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"Job(Task: {self.task}, Status: {self.status}, Run at: {self.run_at})"
+
+
+class JobRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id'), index=True)
+    started_at = db.Column(db.DateTime, index=True)
+    latency_ms = db.Column(db.Integer)    # started_at - run_at
+    duration_ms = db.Column(db.Integer)
+    succeeded = db.Column(db.Boolean)
+    error = db.Column(db.Text)
+
+    job = db.relationship('Job', backref=db.backref('runs', lazy=True))
+
+    def __repr__(self):
+        return f"JobRun(Job: {self.job_id}, Duration: {self.duration_ms}ms, OK: {self.succeeded})"
+
+
+class GadgetRecommendation(db.Model):
+    # "Customers also rented" neighbours, rebuilt offline by recommendations.py
+    gadget_id = db.Column(db.Integer, db.ForeignKey('gadget.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey('gadget.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"GadgetRecommendation({self.gadget_id} -> {self.related_id}, Score: {self.score:.3f})"
+
+
+class ReportExport(db.Model):
+    # A report queued for background generation; the artifact is a gzipped file on disk
+    id = db.Column(db.Integer, primary_key=True)
+    report = db.Column(db.String(50), nullable=False)      # key of reports.REPORTS
+    format = db.Column(db.String(10), default='csv')       # csv, jsonl
+    date_from = db.Column(db.Date)                         # None = open-ended
+    date_to = db.Column(db.Date)
+    status = db.Column(db.String(20), default='queued')    # queued, running, done, failed
+    rows_total = db.Column(db.Integer)                     # known once the query has run
+    rows_written = db.Column(db.Integer, default=0)
+    path = db.Column(db.String(255))
+    size_bytes = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    requested_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"ReportExport({self.report}.{self.format}, Status: {self.status})"
+
+
+class TableVersion(db.Model):
+    # Bumped in the same transaction as any write to a versioned table (see versions.py)
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"TableVersion({self.name}: {self.version})"
+
+
+class TrendingEpoch(db.Model):
+    # Single row: the reference time Gadget.trending_score is scaled against (see trending.py)
+    id = db.Column(db.Integer, primary_key=True)
+    epoch = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"TrendingEpoch({self.epoch})"
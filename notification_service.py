@@ -0,0 +1,193 @@
+# notification_service.py
+# Batch notification jobs that run on the background scheduler.
+
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from extensions import db
+from models import User, CartItem, Notification
+from email_service import send_cart_reminder_email
+from scheduler import enqueue
+
+
+CART_REMINDER_MESSAGE = 'You have items in your cart! Complete your order soon.'
+
+
+def send_cart_reminders(chunk_size=5000):
+    """
+    Remind every user whose cart has been idle for CART_REMINDER_AFTER_HOURS.
+
+    Users are found chunk by chunk with a keyset-paginated GROUP BY over the
+    (user_id, updated_at) index on CartItem. A user is skipped if they were
+    already reminded since their last cart activity or within the cooldown.
+    Each chunk inserts its notifications in bulk, stamps cart_reminded_at and
+    queues one email job, then commits to keep write locks short.
+    """
+    now = datetime.utcnow()
+    abandoned_before = now - timedelta(hours=current_app.config.get('CART_REMINDER_AFTER_HOURS', 24))
+    cooldown_before = now - timedelta(hours=current_app.config.get('CART_REMINDER_COOLDOWN_HOURS', 72))
+    started = time.perf_counter()
+
+    last_activity = db.func.max(CartItem.updated_at)
+    # One value per group; wrapped in max() so grouping stays on the index order
+    reminded_at = db.func.max(User.cart_reminded_at)
+    reminded, chunks, after_user_id = 0, 0, 0
+    while True:
+        rows = db.session.query(CartItem.user_id, db.func.sum(CartItem.quantity)) \
+                         .join(User, User.id == CartItem.user_id) \
+                         .filter(CartItem.user_id > after_user_id, User.is_active.isnot(False)) \
+                         .filter(db.or_(User.cart_reminded_at.is_(None),
+                                        User.cart_reminded_at < cooldown_before)) \
+                         .group_by(CartItem.user_id) \
+                         .having(last_activity < abandoned_before) \
+                         .having(db.or_(reminded_at.is_(None), reminded_at < last_activity)) \
+                         .order_by(CartItem.user_id) \
+                         .limit(chunk_size).all()
+        if not rows:
+            break
+
+        user_ids = [user_id for user_id, _ in rows]
+        db.session.execute(db.insert(Notification), [
+            {'user_id': user_id, 'message': CART_REMINDER_MESSAGE, 'is_read': False, 'created_at': now}
+            for user_id in user_ids
+        ])
+        User.query.filter(User.id.in_(user_ids)) \
+                  .update({User.cart_reminded_at: now}, synchronize_session=False)
+        enqueue('send_cart_reminder_emails', reminders=[[user_id, int(count or 0)] for user_id, count in rows])
+        db.session.commit()
+
+        reminded += len(rows)
+        chunks += 1
+        after_user_id = user_ids[-1]
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        'reminded': reminded,
+        'chunks': chunks,
+        'seconds': round(elapsed, 3),
+        'per_second': round(reminded / elapsed) if elapsed else reminded,
+    }
+    current_app.logger.info(f"Cart reminders: {stats}")
+    return stats
+
+
+def send_cart_reminder_emails(reminders):
+    """Email one chunk of reminded users; `reminders` is a list of [user_id, item_count]."""
+    counts = dict(reminders)
+    users = User.query.with_entities(User.id, User.email, User.name) \
+                      .filter(User.id.in_(counts)).all()
+    for user_id, email, name in users:
+        send_cart_reminder_email(email, name, counts[user_id])
+
+
+# --- Retention ---
+
+DIGEST_MESSAGE = 'Daily digest'
+
+
+def _delete_in_batches(ids, batch_size):
+    """Delete the rows an id query selects, `batch_size` at a time, committing after each batch."""
+    deleted = 0
+    while True:
+        count = Notification.query.filter(Notification.id.in_(ids.limit(batch_size).scalar_subquery())) \
+                                  .delete(synchronize_session=False)
+        db.session.commit()
+        if not count:
+            return deleted
+        deleted += count
+
+
+def compact_notifications(batch_size=None):
+    """
+    Enforce notification retention, one short transaction per batch:
+
+    1. Read notifications older than NOTIFICATION_COMPACT_AFTER_DAYS are
+       folded into one digest row per user per day (digest_count += n).
+    2. Anything older than NOTIFICATION_RETENTION_DAYS is deleted.
+    3. Users over NOTIFICATION_MAX_PER_USER lose their oldest rows.
+    """
+    config = current_app.config
+    batch_size = batch_size or config.get('NOTIFICATION_DELETE_BATCH', 5000)
+    now = datetime.utcnow()
+    compact_before = now - timedelta(days=config.get('NOTIFICATION_COMPACT_AFTER_DAYS', 7))
+    retain_after = now - timedelta(days=config.get('NOTIFICATION_RETENTION_DAYS', 90))
+    per_user = config.get('NOTIFICATION_MAX_PER_USER', 200)
+    started = time.perf_counter()
+
+    compacted = 0
+    while True:
+        # Delete and read back in one statement, so a batch is only ever digested once
+        batch = db.session.query(Notification.id) \
+                          .filter(Notification.is_read == True, Notification.digest_count.is_(None),
+                                  Notification.created_at < compact_before,
+                                  Notification.created_at >= retain_after) \
+                          .limit(batch_size)
+        rows = db.session.execute(
+            db.delete(Notification).where(Notification.id.in_(batch.scalar_subquery()))
+                                   .returning(Notification.user_id, Notification.created_at)
+        ).all()
+        if not rows:
+            break
+        per_day = Counter((user_id, datetime.combine(created_at.date(), datetime.min.time()))
+                          for user_id, created_at in rows)
+        stmt = sqlite_insert(Notification)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Notification.user_id, Notification.created_at],
+            index_where=Notification.digest_count.isnot(None),
+            set_={'digest_count': Notification.digest_count + stmt.excluded.digest_count}
+        )
+        db.session.execute(stmt, [
+            {'user_id': user_id, 'created_at': day, 'digest_count': count,
+             'message': DIGEST_MESSAGE, 'is_read': True}
+            for (user_id, day), count in per_day.items()
+        ])
+        db.session.commit()
+        compacted += len(rows)
+
+    expired = _delete_in_batches(
+        db.session.query(Notification.id).filter(Notification.created_at < retain_after)
+                                         .order_by(Notification.created_at), batch_size)
+
+    over_cap = 0
+    # Digests are bounded by retention (one per user per day), so only plain rows count
+    crowded = [user_id for (user_id,) in db.session.query(Notification.user_id)
+                                                 .filter(Notification.digest_count.is_(None))
+                                                 .group_by(Notification.user_id)
+                                                 .having(db.func.count(Notification.id) > per_user)]
+    for user_id in crowded:
+        # Rows past the user's newest `per_user`; the offset skips the kept ones on every batch
+        over_cap += _delete_in_batches(
+            db.session.query(Notification.id).filter(Notification.user_id == user_id,
+                                                     Notification.digest_count.is_(None))
+                      .order_by(Notification.created_at.desc(), Notification.id.desc())
+                      .offset(per_user), batch_size)
+
+    elapsed = time.perf_counter() - started
+    stats = {'compacted': compacted, 'expired': expired, 'over_cap': over_cap,
+             'seconds': round(elapsed, 3)}
+    current_app.logger.info(f"Notification retention: {stats}")
+    return stats
+
+
+def notification_stats():
+    """Row counts, plus on-disk size when SQLite was built with the dbstat table."""
+    rows, unread, digests, digested = db.session.query(
+        db.func.count(Notification.id),
+        db.func.sum(db.case((Notification.is_read.isnot(True), 1), else_=0)),
+        db.func.count(Notification.digest_count),
+        db.func.sum(Notification.digest_count)
+    ).one()
+    try:
+        size = db.session.execute(db.text(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE tbl_name = 'notification')"
+        )).scalar()
+    except OperationalError:
+        db.session.rollback()
+        size = None
+    return {'rows': rows, 'unread': unread or 0, 'digest_rows': digests,
+            'digested_notifications': digested or 0, 'bytes': size}
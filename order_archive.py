@@ -0,0 +1,148 @@
+# order_archive.py
+# Hot/cold split of rental orders.
+#
+# Closed orders (cancelled, or returned with the deposit refunded) older than
+# ORDER_ARCHIVE_AFTER_DAYS are moved from rental_order to
+# archived_rental_order in batches, keeping their ids. Day-to-day pages
+# (cart, checkout, my orders, admin orders, the overdue sweep) only ever
+# touch the live table. Code that needs full history asks order_history()
+# for an entity to query: plain RentalOrder when the archive holds nothing
+# in the requested range, otherwise an alias of RentalOrder over
+# "live UNION ALL archive". Both tables carry the same indexes, and SQLite
+# pushes the WHERE clause into each half of the union.
+#
+# Archived ids must never come back: rental_order is declared AUTOINCREMENT
+# so SQLite hands out ids above every id it has ever used, not just above
+# the ids still in the table. Databases created before that are rebuilt by
+# migrate_order_ids(), which the archival job runs before moving anything
+# (or run it on deploy: python order_archive.py migrate).
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from extensions import db
+from models import RentalOrder, ArchivedRentalOrder, RentalOrderColumns
+
+
+ORDER_COLUMNS = ['id'] + [name for name in vars(RentalOrderColumns) if not name.startswith('_')]
+
+
+def _closed_before(cutoff):
+    return db.and_(
+        db.or_(RentalOrder.status == 'cancelled',
+               db.and_(RentalOrder.status == 'returned', RentalOrder.deposit_returned == True)),
+        RentalOrder.created_at < cutoff,
+        RentalOrder.end_date < cutoff.date()
+    )
+
+
+def migrate_order_ids():
+    """
+    Rebuild a rental_order created without AUTOINCREMENT, then make sure its
+    id sequence starts above every archived id. Returns True if it rebuilt.
+    """
+    table = RentalOrder.__table__
+    dialect = db.engine.dialect
+    conn = sqlite3.connect(db.engine.url.database, timeout=30, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                           (table.name,)).fetchone()
+        if row is None:
+            conn.execute('ROLLBACK')
+            return False
+        rebuild = 'AUTOINCREMENT' not in row[0].upper()
+        if rebuild:
+            # Rename without rewriting the REFERENCES rental_order in other tables
+            conn.execute('PRAGMA legacy_alter_table = ON')
+            for index in table.indexes:
+                conn.execute(f'DROP INDEX IF EXISTS {index.name}')
+            conn.execute(f'ALTER TABLE {table.name} RENAME TO _{table.name}_old')
+            conn.execute(str(CreateTable(table).compile(dialect=dialect)))
+            for index in table.indexes:
+                conn.execute(str(CreateIndex(index).compile(dialect=dialect)))
+            columns = ', '.join(ORDER_COLUMNS)
+            conn.execute(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM _{table.name}_old')
+            conn.execute(f'DROP TABLE _{table.name}_old')
+        archived_max = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {ArchivedRentalOrder.__tablename__}').fetchone()[0]
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT ?, 0 "
+                     "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)", (table.name, table.name))
+        conn.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?',
+                     (archived_max, table.name, archived_max))
+        conn.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    if rebuild:
+        current_app.logger.info(f"Rebuilt {table.name} with AUTOINCREMENT ids above {archived_max}")
+    return rebuild
+
+
+def archive_closed_orders(batch_size=None, after_days=None):
+    """Move closed orders older than the threshold to the archive, one committed batch at a time."""
+    migrate_order_ids()
+    batch_size = batch_size or current_app.config.get('ORDER_ARCHIVE_BATCH_SIZE', 5000)
+    after_days = after_days or current_app.config.get('ORDER_ARCHIVE_AFTER_DAYS', 180)
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    archived = 0
+    while True:
+        ids = [order_id for (order_id,) in db.session.query(RentalOrder.id)
+                                                    .filter(_closed_before(cutoff))
+                                                    .order_by(RentalOrder.id).limit(batch_size)]
+        if not ids:
+            return archived
+        live_columns = [getattr(RentalOrder, name) for name in ORDER_COLUMNS]
+        db.session.execute(
+            db.insert(ArchivedRentalOrder).from_select(
+                ORDER_COLUMNS + ['archived_at'],
+                db.select(*live_columns, db.literal(datetime.utcnow(), db.DateTime))
+                  .where(RentalOrder.id.in_(ids))
+            )
+        )
+        RentalOrder.query.filter(RentalOrder.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        archived += len(ids)
+
+
+def archive_reaches(column, since=None):
+    """True when archived orders may have `column` >= since (since=None: any archived order)."""
+    latest = db.session.query(db.func.max(getattr(ArchivedRentalOrder, column))).scalar()
+    return latest is not None and (since is None or latest >= since)
+
+
+def order_history(since=None, column='created_date'):
+    """
+    Entity to query orders with, including archived ones when `since` (a
+    lower bound on `column`, None for all history) reaches into the archive.
+    Rows loaded through the union alias are read-only snapshots.
+    """
+    if not archive_reaches(column, since):
+        return RentalOrder
+    orders = db.union_all(
+        db.select(*[getattr(RentalOrder, name) for name in ORDER_COLUMNS]),
+        db.select(*[getattr(ArchivedRentalOrder, name) for name in ORDER_COLUMNS])
+    ).subquery('order_history')
+    return db.aliased(RentalOrder, orders, adapt_on_names=True)
+
+
+def find_order(order_id):
+    """A live order, or its archived copy, or None."""
+    return db.session.get(RentalOrder, order_id) or db.session.get(ArchivedRentalOrder, order_id)
+
+
+if __name__ == '__main__':
+    import sys
+
+    from app import app
+
+    if sys.argv[1:] != ['migrate']:
+        sys.exit("usage: python order_archive.py migrate")
+    with app.app_context():
+        print('rental_order rebuilt' if migrate_order_ids() else 'rental_order already uses AUTOINCREMENT')
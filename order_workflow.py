@@ -0,0 +1,206 @@
+# order_workflow.py
+# Declarative order status transitions, applied to one or many orders at once.
+
+from collections import namedtuple
+from datetime import datetime
+
+from extensions import db
+from models import User, Gadget, RentalOrder, Notification, OverdueRental
+from email_service import send_deposit_refund_confirmation_email
+from inventory import record_movements
+from trust import apply_trust_events
+
+
+# Stock is deducted at checkout, so every transition that ends a rental early
+# (or completes it) puts the rented units back through the stock ledger.
+ORDER_TRANSITIONS = {
+    'approve': {
+        'from': ('booked',),
+        'to': 'approved',
+        'notify': "Your order #{id} has been approved.",
+        'done': "approved",
+    },
+    'reject': {
+        'from': ('booked',),
+        'to': 'cancelled',
+        'set': {'cancelled_by': 'admin'},
+        'restock': 'reject',
+        'notify': "Your order #{id} has been rejected.",
+        'done': "rejected",
+    },
+    'mark_active': {
+        'from': ('approved',),
+        'to': 'active',
+        'notify': "Your order #{id} is now Active and being processed.",
+        'done': "marked as Active",
+    },
+    'mark_delivered': {
+        'from': ('active',),
+        'to': 'delivered',
+        'notify': "Your order #{id} has been delivered.",
+        'done': "marked as delivered",
+    },
+    'mark_returned': {
+        'from': ('delivered', 'active', 'overdue'),
+        'to': 'returned',
+        'restock': 'return',
+        'trust': lambda row: 'on_time_return' if row.status != 'overdue' else None,
+        'notify': "Your order #{id} has been marked Returned. Thank you!",
+        'done': "marked as returned",
+    },
+    'refund_deposit': {
+        'from': ('returned',),
+        'where': RentalOrder.deposit_returned.isnot(True),
+        'set': {'deposit_returned': True},
+        'trust': lambda row: 'deposit_refunded',
+        'notify': "Your security deposit for order #{id} has been refunded.",
+        'email': lambda row: send_deposit_refund_confirmation_email(
+            row.email, row.name, row.id, row.security_deposit
+        ),
+        'done': "deposit refunded",
+    },
+    'cancel': {
+        'from': ('booked', 'approved', 'active', 'delivered', 'overdue'),
+        'to': 'cancelled',
+        'set': {'cancelled_by': 'admin'},
+        'restock': 'cancel',
+        'notify': "Your order #{id} has been cancelled by the admin.",
+        'done': "cancelled",
+    },
+}
+
+
+# An order as it was when a transition applied to it (status is the old one)
+AppliedOrder = namedtuple('AppliedOrder', 'id user_id gadget_id quantity security_deposit status email name')
+
+
+def rental_price(price_per_day, quantity, days):
+    """Per-day pricing shared by the cart, checkout and late fees."""
+    return (price_per_day or 0) * (quantity or 1) * days
+
+
+def apply_transition(action, order_ids):
+    """
+    Apply `action` to every order in `order_ids` that is in an allowed status,
+    using set-based updates and one commit. Returns (applied_ids, skipped_ids).
+    """
+    transition = ORDER_TRANSITIONS[action]
+    order_ids = list(set(order_ids))
+    if not order_ids:
+        return [], []
+
+    values = dict(transition.get('set', {}))
+    if transition.get('to'):
+        values['status'] = transition['to']
+
+    # The guarded UPDATE decides which orders move: RETURNING reports only the
+    # rows this transaction changed, so a concurrent admin acting on the same
+    # order gets it back as skipped and no side effect runs twice. One UPDATE
+    # per source status keeps the old status, which some trust rules need.
+    changed = []
+    for status in transition['from']:
+        stmt = db.update(RentalOrder) \
+                 .where(RentalOrder.id.in_(order_ids), RentalOrder.status == status) \
+                 .values(values) \
+                 .returning(RentalOrder.id, RentalOrder.user_id, RentalOrder.gadget_id,
+                            RentalOrder.quantity, RentalOrder.security_deposit) \
+                 .execution_options(synchronize_session=False)
+        if 'where' in transition:
+            stmt = stmt.where(transition['where'])
+        changed.extend((status, row) for row in db.session.execute(stmt))
+
+    applied = {row.id for _, row in changed}
+    applied_ids = [order_id for order_id in order_ids if order_id in applied]
+    skipped_ids = [order_id for order_id in order_ids if order_id not in applied]
+    if not changed:
+        db.session.rollback()
+        return applied_ids, skipped_ids
+
+    users = {user_id: (email, name) for user_id, email, name in
+             db.session.query(User.id, User.email, User.name)
+                       .filter(User.id.in_({row.user_id for _, row in changed}))}
+    rows = [AppliedOrder(row.id, row.user_id, row.gadget_id, row.quantity, row.security_deposit, status,
+                         *users.get(row.user_id, (None, None)))
+            for status, row in changed]
+
+    if transition.get('restock'):
+        record_movements([(row.gadget_id, row.quantity or 1, transition['restock'], row.id)
+                          for row in rows])
+
+    if transition.get('trust'):
+        apply_trust_events([(row.user_id, transition['trust'](row)) for row in rows
+                            if transition['trust'](row)])
+
+    if 'overdue' in transition['from']:
+        OverdueRental.query.filter(OverdueRental.order_id.in_(applied_ids)).delete(synchronize_session=False)
+
+    if transition.get('notify'):
+        now = datetime.utcnow()
+        db.session.execute(db.insert(Notification), [
+            {'user_id': row.user_id, 'message': transition['notify'].format(id=row.id),
+             'is_read': False, 'created_at': now}
+            for row in rows
+        ])
+
+    db.session.commit()
+
+    # Emails go out only once the transaction is safely committed
+    if transition.get('email'):
+        for row in rows:
+            transition['email'](row)
+
+    return applied_ids, skipped_ids
+
+
+def sweep_overdue_orders(today=None):
+    """
+    Move active/delivered orders past their end date to 'overdue' with one
+    UPDATE, refresh late fees of every overdue order and rebuild the
+    OverdueRental table behind the admin overdue dashboard.
+    """
+    today = today or datetime.utcnow().date()
+    now = datetime.utcnow()
+
+    newly_overdue = db.session.query(RentalOrder.id, RentalOrder.user_id) \
+                              .filter(RentalOrder.status.in_(('active', 'delivered')),
+                                      RentalOrder.end_date < today).all()
+    if newly_overdue:
+        RentalOrder.query.filter(RentalOrder.id.in_([order_id for order_id, _ in newly_overdue]),
+                                 RentalOrder.status.in_(('active', 'delivered'))) \
+                         .update({RentalOrder.status: 'overdue'}, synchronize_session=False)
+        db.session.execute(db.insert(Notification), [
+            {'user_id': user_id, 'is_read': False, 'created_at': now,
+             'message': f"Your rental #{order_id} is overdue. Late fees apply until it is returned."}
+            for order_id, user_id in newly_overdue
+        ])
+        apply_trust_events([(user_id, 'overdue') for _, user_id in newly_overdue])
+
+    overdue = db.session.query(
+        RentalOrder.id, RentalOrder.user_id, RentalOrder.gadget_id, RentalOrder.quantity,
+        RentalOrder.end_date, Gadget.price_per_day, Gadget.name.label('gadget_name'),
+        User.name.label('user_name'), User.email.label('user_email')
+    ).join(Gadget, Gadget.id == RentalOrder.gadget_id) \
+     .join(User, User.id == RentalOrder.user_id) \
+     .filter(RentalOrder.status == 'overdue').all()
+
+    dashboard = []
+    for row in overdue:
+        days_overdue = (today - row.end_date).days
+        dashboard.append({
+            'order_id': row.id, 'user_id': row.user_id, 'gadget_id': row.gadget_id,
+            'user_name': row.user_name, 'user_email': row.user_email, 'gadget_name': row.gadget_name,
+            'end_date': row.end_date, 'days_overdue': days_overdue,
+            'late_fee': rental_price(row.price_per_day, row.quantity, days_overdue),
+            'refreshed_at': now,
+        })
+
+    if dashboard:
+        # Bulk UPDATE by primary key (executemany)
+        db.session.execute(db.update(RentalOrder),
+                           [{'id': d['order_id'], 'late_fee': d['late_fee']} for d in dashboard])
+    OverdueRental.query.delete(synchronize_session=False)
+    if dashboard:
+        db.session.execute(db.insert(OverdueRental), dashboard)
+    db.session.commit()
+
+    return {'newly_overdue': len(newly_overdue), 'overdue': len(dashboard)}
@@ -0,0 +1,244 @@
+# page_cache.py
+# Conditional GET and rendered-markup caching for public catalog pages.
+#
+# A page's ETag is derived from the versions of the tables it reads, the
+# request (endpoint, view args, query string), the viewer and the deployed
+# templates/assets. When the browser already holds that version the view is
+# not run at all and a 304 is returned.
+#
+# Gadget cards are cached per (gadget id, card_version) in an in-process LRU
+# with a byte budget; anonymous home page renders share the same cache.
+
+import atexit
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session, make_response, render_template, Response
+from flask_login import current_user
+from markupsafe import Markup
+
+from extensions import db
+from models import Gadget
+from versions import table_versions
+
+
+_render_version = None
+
+
+def render_version():
+    """Fingerprint of the templates and asset manifest, so a deploy changes every ETag."""
+    global _render_version
+    if _render_version is None:
+        digest = hashlib.sha1()
+        roots = [os.path.join(current_app.root_path, 'templates'),
+                 os.path.join(current_app.static_folder, 'dist')]
+        for root in roots:
+            for dirpath, _, filenames in sorted(os.walk(root)):
+                for filename in sorted(filenames):
+                    if filename.endswith(('.html', '.json')):
+                        path = os.path.join(dirpath, filename)
+                        digest.update(f"{path}:{os.stat(path).st_mtime_ns}".encode())
+        _render_version = digest.hexdigest()[:12]
+    return _render_version
+
+
+def conditional_page(*tables, validator=None):
+    """
+    Answer 304 Not Modified when none of `tables` changed since the client's
+    copy. `validator(**view_kwargs)`, if given, returns a value that goes into
+    the ETag too, for page data whose writes don't bump a table version; such
+    pages get no Last-Modified, since that can't reflect it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # A pending flash message is part of the page
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            versions = table_versions(tables)
+            viewer = current_user.get_id() if current_user.is_authenticated else 'anon'
+            key = repr((request.endpoint, sorted(kwargs.items()), sorted(request.args.items(multi=True)),
+                        viewer, sorted((name, v) for name, (v, _) in versions.items()), render_version(),
+                        validator(**kwargs) if validator else None))
+            etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+            changed = [updated_at for _, updated_at in versions.values() if updated_at and not validator]
+            last_modified = max(changed).replace(microsecond=0) if changed else None
+
+            not_modified = request.if_none_match.contains_weak(etag) if request.if_none_match else (
+                last_modified is not None and request.if_modified_since is not None
+                and last_modified <= request.if_modified_since.replace(tzinfo=None))
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True  # always revalidate, but reuse on 304
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+# --- Gadget view counts ---
+# Counted in memory and written in bulk, so a detail page view does not write
+# to the database (or change the gadget table's version). The counter lives
+# in each worker process, so each process flushes its own: a timer thread
+# started by the first view it records, plus a last flush at exit.
+
+_pending_views = Counter()
+_views_lock = threading.Lock()
+_flusher_pid = None
+
+
+def record_gadget_view(gadget_id):
+    with _views_lock:
+        _pending_views[gadget_id] += 1
+        if _flusher_pid != os.getpid():
+            _start_view_flusher(current_app._get_current_object())
+
+
+def _start_view_flusher(app):
+    # Called with _views_lock held; a forked worker starts its own thread
+    global _flusher_pid
+    _flusher_pid = os.getpid()
+    interval = app.config.get('GADGET_VIEW_FLUSH_SECONDS', 60)
+
+    def flush():
+        with app.app_context():
+            try:
+                flush_gadget_views()
+            except Exception:
+                app.logger.exception("Flushing gadget view counts failed")
+
+    def run():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    threading.Thread(target=run, name='gadget-view-flusher', daemon=True).start()
+    atexit.register(flush)
+
+
+def flush_gadget_views():
+    global _pending_views
+    with _views_lock:
+        views, _pending_views = _pending_views, Counter()
+    if not views:
+        return 0
+    try:
+        Gadget.query.filter(Gadget.id.in_(views)) \
+                    .execution_options(bump_versions=False) \
+                    .update({Gadget.view_count: Gadget.view_count + db.case(dict(views), value=Gadget.id, else_=0)},
+                            synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        with _views_lock:
+            _pending_views.update(views)  # try again on the next run
+        raise
+    return sum(views.values())
+
+
+# --- Fragment cache ---
+
+class FragmentCache:
+    """LRU of rendered markup bounded by the total size of the cached strings."""
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (markup, size)
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        markup = render()
+        size = len(markup.encode('utf-8'))
+        if size > self.max_bytes:
+            return markup
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (markup, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        return markup
+
+    def discard(self, match):
+        with self.lock:
+            for key in [key for key in self.entries if match(key)]:
+                self.bytes -= self.entries.pop(key)[1]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+fragment_cache = FragmentCache()
+
+
+def gadget_card(gadget, style='catalog'):
+    """Rendered partials/<style>_gadget_card.html for one gadget, cached per card_version."""
+    key = ('card', style, gadget.id, gadget.card_version or 0,
+           current_user.is_authenticated, render_version())
+    return Markup(fragment_cache.get_or_render(
+        key, lambda: render_template(f'partials/{style}_gadget_card.html', gadget=gadget)))
+
+
+def touch_gadget_card(gadget):
+    """Invalidate a gadget's cached cards here and, via card_version, in every other worker."""
+    gadget.card_version = (gadget.card_version or 0) + 1
+    fragment_cache.discard(lambda key: key[0] == 'card' and key[2] == gadget.id)
+
+
+def cached_for_anonymous(*tables):
+    """Cache the whole rendered page for logged-out visitors until one of `tables` changes."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_user.is_authenticated or session.get('_flashes'):
+                return view(*args, **kwargs)
+            versions = table_versions(tables)
+            key = ('page', request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))),
+                   tuple(sorted((name, v) for name, (v, _) in versions.items())), render_version())
+            return fragment_cache.get_or_render(key, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def init_page_cache(app):
+    fragment_cache.max_bytes = app.config.get('FRAGMENT_CACHE_MAX_BYTES', fragment_cache.max_bytes)
+    app.jinja_env.globals['gadget_card'] = gadget_card
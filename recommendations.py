@@ -0,0 +1,87 @@
+# recommendations.py
+# "Customers also rented": top-K co-rental neighbours per gadget.
+#
+# Built offline from rental history. Each user's rented gadgets form a row of
+# a binary user x gadget matrix A; the gadget x gadget co-occurrence matrix is
+# A^T A, accumulated over chunks of users so A is never held in full. Scores
+# are cosine similarities (co-rentals / sqrt(renters_i * renters_j)), so a
+# gadget everybody rents does not become everyone's neighbour. The top K per
+# gadget go into GadgetRecommendation, which gadget_detail reads by gadget id.
+
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+
+from extensions import db
+from models import Gadget, GadgetRecommendation
+from order_archive import order_history
+
+
+def _co_rental_matrix(gadget_ids, user_chunk=20000):
+    """Gadget x gadget co-rental counts and per-gadget renter counts."""
+    history = order_history()
+    pairs = np.array(db.session.query(history.user_id, history.gadget_id)
+                               .filter(history.user_id.isnot(None), history.gadget_id.isnot(None))
+                               .distinct().all(), dtype=np.int64).reshape(-1, 2)
+    n = gadget_ids.size
+    co = np.zeros((n, n), dtype=np.float64)
+    if pairs.size == 0:
+        return co, np.zeros(n)
+
+    column = np.searchsorted(gadget_ids, pairs[:, 1])
+    known = (column < n) & (gadget_ids[np.minimum(column, n - 1)] == pairs[:, 1])
+    users, row = np.unique(pairs[known, 0], return_inverse=True)
+    column = column[known]
+
+    # A^T A over slices of users; each slice is a small dense block
+    order = np.argsort(row, kind='stable')
+    row, column = row[order], column[order]
+    bounds = np.searchsorted(row, np.arange(0, users.size + user_chunk, user_chunk))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start == end:
+            continue
+        block = np.zeros((row[end - 1] - row[start] + 1, n), dtype=np.float32)
+        block[row[start:end] - row[start], column[start:end]] = 1.0
+        co += block.T @ block
+    return co, np.diag(co).copy()
+
+
+def rebuild_recommendations(top_k=None):
+    """Recompute every gadget's neighbours and replace the table in one transaction."""
+    top_k = top_k or current_app.config.get('RECOMMENDATIONS_PER_GADGET', 6)
+    gadget_ids = np.array(sorted(gadget_id for (gadget_id,) in db.session.query(Gadget.id)), dtype=np.int64)
+    rows = []
+    if gadget_ids.size > 1:
+        co, renters = _co_rental_matrix(gadget_ids)
+        np.fill_diagonal(co, 0)
+        norm = np.sqrt(np.outer(renters, renters))
+        scores = np.divide(co, norm, out=np.zeros_like(co), where=norm > 0)
+
+        k = min(top_k, gadget_ids.size - 1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        ranked = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, ranked, axis=1)
+        top_scores = np.take_along_axis(top_scores, ranked, axis=1)
+
+        now = datetime.utcnow()
+        for i, gadget_id in enumerate(gadget_ids.tolist()):
+            for rank, (j, score) in enumerate(zip(top[i].tolist(), top_scores[i].tolist())):
+                if score <= 0:
+                    break
+                rows.append({'gadget_id': gadget_id, 'rank': rank, 'related_id': int(gadget_ids[j]),
+                             'score': score, 'created_at': now})
+
+    GadgetRecommendation.query.delete(synchronize_session=False)
+    if rows:
+        db.session.execute(db.insert(GadgetRecommendation), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def related_gadgets(gadget_id, limit=4):
+    """Precomputed neighbours of one gadget that are still active, best first."""
+    return Gadget.query.join(GadgetRecommendation, GadgetRecommendation.related_id == Gadget.id) \
+                       .filter(GadgetRecommendation.gadget_id == gadget_id, Gadget.is_active == True) \
+                       .order_by(GadgetRecommendation.rank).limit(limit).all()
@@ -0,0 +1,107 @@
+# report_cache.py
+# In-process cache of admin report results.
+#
+# Entries are keyed by (report, start, end) and tagged with the versions of
+# the tables the report reads (see versions.py). Once a write moves one of
+# those versions the entry is stale. A stale entry younger than
+# stale_seconds is still served, and a background thread recomputes it, so a
+# reload right after a new order does not wait on the GROUP BY. Older stale
+# entries are recomputed inline. Every entry also expires after ttl_seconds,
+# because some reports depend on today's date as well as the data. The cache
+# holds at most max_entries results, evicting the least recently used.
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from reports import REPORTS
+from versions import table_versions
+
+
+class ReportCache:
+    def __init__(self, max_entries=200, stale_seconds=600, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.ttl = ttl_seconds
+        self.entries = OrderedDict()  # key -> (rows, generation, computed_at)
+        self.refreshing = set()
+        self.counts = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_errors': 0}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def generation(report):
+        tables = REPORTS[report][3]
+        versions = table_versions(tables)
+        return tuple(versions[name][0] for name in sorted(tables))
+
+    def _compute(self, key):
+        report, start, end = key
+        generation = self.generation(report)  # read first, so a write during the query leaves it stale
+        rows = REPORTS[report][1](start, end)
+        with self.lock:
+            self.entries[key] = (rows, generation, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return rows
+
+    def _refresh(self, app, key):
+        try:
+            with app.app_context():
+                self._compute(key)
+            with self.lock:
+                self.counts['refreshes'] += 1
+        except Exception as e:
+            with self.lock:
+                self.counts['refresh_errors'] += 1
+            app.logger.error(f"Report cache refresh of {key[0]} failed: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def rows(self, report, start=None, end=None):
+        key = (report, start, end)
+        generation = self.generation(report)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[2] > self.ttl:
+                entry = None
+            if entry is not None and entry[1] == generation:
+                self.entries.move_to_end(key)
+                self.counts['hits'] += 1
+                return entry[0]
+            serve_stale = entry is not None and now - entry[2] <= self.stale_seconds
+            if serve_stale:
+                self.entries.move_to_end(key)
+                self.counts['stale_hits'] += 1
+                start_refresh = key not in self.refreshing
+                self.refreshing.add(key)
+            else:
+                self.counts['misses'] += 1
+
+        if not serve_stale:
+            return self._compute(key)
+        if start_refresh:
+            threading.Thread(target=self._refresh, args=(current_app._get_current_object(), key),
+                             name='report-cache-refresh', daemon=True).start()
+        return entry[0]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counts['hits'] + self.counts['stale_hits'] + self.counts['misses']
+            return {**self.counts, 'entries': len(self.entries), 'max_entries': self.max_entries,
+                    'refreshing': len(self.refreshing),
+                    'hit_rate': round((self.counts['hits'] + self.counts['stale_hits']) / lookups, 4)
+                                if lookups else None}
+
+
+report_cache = ReportCache()
+
+
+def init_report_cache(app):
+    report_cache.max_entries = app.config.get('REPORT_CACHE_MAX_ENTRIES', report_cache.max_entries)
+    report_cache.stale_seconds = app.config.get('REPORT_CACHE_STALE_SECONDS', report_cache.stale_seconds)
+    report_cache.ttl = app.config.get('REPORT_CACHE_TTL_SECONDS', report_cache.ttl)
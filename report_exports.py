@@ -0,0 +1,93 @@
+# report_exports.py
+# Reports generated in the background and downloaded later.
+#
+# An admin queues a ReportExport (report, date range, format); a scheduler
+# worker runs the report query and streams the rows through gzip into a temp
+# file beside the final one, updating rows_written as it goes, then renames
+# it into place. Downloads go through send_file, so Range requests can
+# resume a partial download.
+
+import gzip
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from extensions import db
+from models import ReportExport
+from reports import report_stream, write_report
+from scheduler import enqueue
+
+
+def export_folder():
+    folder = current_app.config['REPORT_EXPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def export_filename(export):
+    span = f"{export.date_from or 'start'}_{export.date_to or 'today'}"
+    return f"{export.report}_{span}.{export.format}.gz"
+
+
+def queue_report_export(report, fmt, start, end, user_id=None):
+    """Create the export and the job that builds it. The caller commits."""
+    export = ReportExport(report=report, format=fmt, date_from=start, date_to=end, requested_by=user_id)
+    db.session.add(export)
+    db.session.flush()
+    enqueue('generate_report_export', max_attempts=1, export_id=export.id)
+    return export
+
+
+def _update_export(export_id, **values):
+    ReportExport.query.filter(ReportExport.id == export_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def generate_report_export(export_id):
+    export = db.session.get(ReportExport, export_id)
+    if export is None or export.status == 'done':
+        return
+    report, fmt = export.report, export.format
+    path = os.path.join(export_folder(), f"{export_id}-{export_filename(export)}")
+    _update_export(export_id, status='running', rows_written=0, error=None)
+
+    try:
+        total, rows = report_stream(report, export.date_from, export.date_to)
+        _update_export(export_id, rows_total=total)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as gz, \
+                    io.TextIOWrapper(gz, encoding='utf-8', newline='') as out:
+                written = write_report(report, rows, out, fmt,
+                                       progress=lambda n: _update_export(export_id, rows_written=n))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except Exception as e:
+        db.session.rollback()
+        _update_export(export_id, status='failed', error=f"{type(e).__name__}: {e}",
+                       finished_at=datetime.utcnow())
+        raise
+
+    _update_export(export_id, status='done', rows_written=written, path=path,
+                   size_bytes=os.path.getsize(path), finished_at=datetime.utcnow())
+
+
+def prune_report_exports(days=7):
+    """Delete exports (and their files) finished more than `days` ago."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    old = ReportExport.query.filter(ReportExport.status.in_(('done', 'failed')),
+                                    ReportExport.finished_at < cutoff).all()
+    paths = [export.path for export in old if export.path]
+    ReportExport.query.filter(ReportExport.id.in_([export.id for export in old])) \
+                      .delete(synchronize_session=False)
+    db.session.commit()
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    return len(old)
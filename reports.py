@@ -0,0 +1,410 @@
+# reports.py
+# Admin report queries and their CSV/JSONL export format.
+#
+# Every report is a function of an inclusive (start, end) date range that
+# returns its rows; REPORTS describes how each row is written out, so the
+# on-page CSV download and the background exports (report_exports.py)
+# produce the same files.
+
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from itertools import chain
+
+import numpy as np
+
+from extensions import db
+from models import Gadget, User, RentalOrder
+from order_archive import order_history
+
+
+# Orders whose units were (or are) physically with a customer
+OUT_STATUSES = ('approved', 'active', 'delivered', 'overdue', 'returned')
+
+# Orders whose units were taken out of stock at checkout and not yet put back
+# (returns, rejections and cancellations restock; see order_workflow.py)
+HOLDING_STATUSES = ('booked', 'approved', 'active', 'delivered', 'overdue')
+
+
+def _day_number(column):
+    return db.cast(db.func.julianday(column), db.Integer)
+
+
+def _load_intervals(start, end, origin):
+    """
+    (gadget_id, quantity, first_day, last_day, is_overdue) rows of orders that
+    overlap [start, end], as an int64 array with days counted from `origin`.
+
+    Split in two so each half is a range scan per status on
+    ix_rental_order_status_end_date, which covers every column read: orders
+    that end in or after the range, and overdue orders that ended before it
+    but are still out. Archived orders are read too when the range reaches
+    back into the archive.
+    """
+    orders = order_history(start, column='end_date')
+    origin_day = _day_number(db.literal(origin.isoformat()))
+    columns = (orders.gadget_id, db.func.coalesce(orders.quantity, 1),
+               _day_number(orders.start_date) - origin_day,
+               _day_number(orders.end_date) - origin_day,
+               db.case((orders.status == 'overdue', 1), else_=0))
+    in_range = db.select(*columns).where(orders.end_date >= start, orders.start_date <= end,
+                                         orders.status.in_(OUT_STATUSES))
+    still_out = db.select(*columns).where(orders.status == 'overdue', orders.end_date < start)
+    rows = db.session.execute(db.union_all(in_range, still_out)).fetchall()
+    # fromiter over the flattened tuples is far cheaper than np.array(rows)
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * 5).reshape(-1, 5)
+
+
+def utilization_report(start, end, today=None):
+    """
+    Share of unit-days each gadget was rented out between `start` and `end`
+    (inclusive), plus per-category totals.
+
+    Rental intervals are loaded as day numbers and swept per gadget: +quantity
+    on the first day, -quantity after the last, then a cumulative sum gives the
+    units out on every day of the range. Overdue orders count until today.
+    Capacity is every unit the gadget owns: its current stock plus the units
+    that orders still hold (booked, or out with a customer).
+    """
+    today = today or date.today()
+    origin = date(2000, 1, 1)
+    r0 = (start - origin).days
+    days = (end - start).days + 1
+    if days <= 0:
+        return {'gadgets': [], 'categories': [], 'days': 0, 'orders': 0}
+
+    gadgets = Gadget.query.with_entities(Gadget.id, Gadget.name, Gadget.category, Gadget.stock) \
+                          .order_by(Gadget.id).all()
+    gadget_ids = np.array([g.id for g in gadgets], dtype=np.int64)
+    n = gadget_ids.size
+    if n == 0:
+        return {'gadgets': [], 'categories': [], 'days': days, 'orders': 0}
+
+    orders = _load_intervals(start, end, origin)
+
+    occupancy = np.zeros(n * (days + 1), dtype=np.int64)
+    if orders.size:
+        gadget_id, quantity, first, last, is_overdue = orders.T
+        last = np.where(is_overdue == 1, np.maximum(last, (today - origin).days), last)
+
+        index = np.searchsorted(gadget_ids, gadget_id)
+        known = (index < n) & (gadget_ids[np.minimum(index, n - 1)] == gadget_id)
+        index, quantity, first, last = index[known], quantity[known], first[known], last[known]
+
+        # Sweep events, clipped to the report range
+        lo = np.clip(first - r0, 0, days)
+        hi = np.clip(last - r0 + 1, 0, days)
+        keep = hi > lo
+        row, quantity_kept = index[keep] * (days + 1), quantity[keep]
+        occupancy += np.bincount(row + lo[keep], weights=quantity_kept, minlength=occupancy.size).astype(np.int64)
+        occupancy -= np.bincount(row + hi[keep], weights=quantity_kept, minlength=occupancy.size).astype(np.int64)
+
+    occupancy = np.cumsum(occupancy.reshape(n, days + 1), axis=1)[:, :days]
+    # Archived orders are all closed, so the live table has every holding order
+    held = dict(db.session.query(RentalOrder.gadget_id, db.func.sum(db.func.coalesce(RentalOrder.quantity, 1)))
+                          .filter(RentalOrder.status.in_(HOLDING_STATUSES))
+                          .group_by(RentalOrder.gadget_id))
+    capacity = np.maximum(np.array([(g.stock or 0) + (held.get(g.id) or 0) for g in gadgets], dtype=np.int64), 0)
+
+    unit_days = occupancy.sum(axis=1)
+    capacity_days = capacity * days
+    peak = occupancy.max(axis=1)
+    full_days = ((occupancy >= capacity[:, None]) & (capacity[:, None] > 0)).sum(axis=1)
+    utilization = np.divide(unit_days, capacity_days, out=np.zeros(n), where=capacity_days > 0)
+
+    gadget_rows = [
+        {'gadget_id': g.id, 'gadget': g.name, 'category': g.category, 'capacity': int(capacity[i]),
+         'unit_days': int(unit_days[i]), 'capacity_days': int(capacity_days[i]),
+         'utilization': float(utilization[i]), 'peak_units_out': int(peak[i]), 'fully_booked_days': int(full_days[i])}
+        for i, g in enumerate(gadgets)
+    ]
+    gadget_rows.sort(key=lambda r: (-r['utilization'], r['gadget'] or ''))
+
+    categories = np.array([g.category or '' for g in gadgets], dtype=object)
+    names, inverse = np.unique(categories, return_inverse=True)
+    cat_unit_days = np.bincount(inverse, weights=unit_days, minlength=names.size)
+    cat_capacity_days = np.bincount(inverse, weights=capacity_days, minlength=names.size)
+    category_rows = [
+        {'category': name, 'gadgets': int((inverse == i).sum()), 'unit_days': int(cat_unit_days[i]),
+         'capacity_days': int(cat_capacity_days[i]),
+         'utilization': float(cat_unit_days[i] / cat_capacity_days[i]) if cat_capacity_days[i] else 0.0}
+        for i, name in enumerate(names.tolist())
+    ]
+    category_rows.sort(key=lambda r: -r['utilization'])
+
+    return {'gadgets': gadget_rows, 'categories': category_rows, 'days': days,
+            'orders': int(orders.shape[0])}
+
+
+def default_report_range(days=30):
+    end = date.today()
+    return end - timedelta(days=days - 1), end
+
+
+def parse_report_range(args, default_days=None):
+    """
+    (start, end) from the `from`/`to` query parameters (YYYY-MM-DD, both
+    inclusive). A missing bound is None (open-ended) unless `default_days`
+    is given, in which case it comes from default_report_range(). Raises
+    ValueError on a malformed date; swaps the bounds if they are reversed.
+    """
+    start, end = default_report_range(default_days) if default_days else (None, None)
+    if args.get('from'):
+        start = datetime.strptime(args['from'], '%Y-%m-%d').date()
+    if args.get('to'):
+        end = datetime.strptime(args['to'], '%Y-%m-%d').date()
+    if start and end and end < start:
+        start, end = end, start
+    return start, end
+
+
+def created_between(query, orders, start, end):
+    """Restrict a query over `orders` to created_date in [start, end] (range predicates, so the index is used)."""
+    if start:
+        query = query.filter(orders.created_date >= start)
+    if end:
+        query = query.filter(orders.created_date <= end)
+    return query
+
+
+# --- Order reports ---
+
+def daily_revenue_query(start=None, end=None):
+    orders = order_history(start)
+    return created_between(db.session.query(
+        orders.created_date.label("date"),
+        db.func.count(orders.id).label("orders"),
+        db.func.sum(orders.total_price).label("revenue"),
+        db.func.avg(orders.total_price).label("avg_revenue"),
+        db.func.max(orders.total_price).label("max_order"),
+        db.func.min(orders.total_price).label("min_order"),
+        db.func.count(db.func.distinct(orders.user_id)).label("unique_customers"),
+        db.func.sum(orders.total_days).label("total_days"),
+        db.func.avg(orders.total_days).label("avg_days")
+    ).filter(orders.payment_status == 'paid'), orders, start, end) \
+     .group_by(orders.created_date) \
+     .order_by(orders.created_date.desc())
+
+
+def _daily_revenue_row(row):
+    return {
+        "date": row.date.strftime("%Y-%m-%d") if hasattr(row.date, "strftime") else str(row.date),
+        "orders": row.orders,
+        "revenue": row.revenue or 0,
+        "avg_revenue": row.avg_revenue or 0,
+        "max_order": row.max_order or 0,
+        "min_order": row.min_order or 0,
+        "unique_customers": row.unique_customers,
+        "total_days": row.total_days or 0,
+        "avg_days": row.avg_days or 0
+    }
+
+
+def daily_revenue_rows(start=None, end=None):
+    return [_daily_revenue_row(row) for row in daily_revenue_query(start, end)]
+
+
+def most_rented_gadgets_query(start=None, end=None):
+    orders = order_history(start)
+    return created_between(db.session.query(
+        Gadget.name.label("gadget"),
+        Gadget.category.label("category"),
+        db.func.count(orders.id).label("total_rentals"),
+        db.func.sum(orders.total_days).label("total_days"),
+        db.func.count(db.func.distinct(orders.user_id)).label("unique_users"),
+        db.func.sum(orders.total_price).label("total_revenue"),
+        db.func.avg(orders.total_price).label("avg_revenue"),
+        db.func.avg(orders.total_days).label("avg_days"),
+        db.func.max(orders.created_at).label("last_rented")
+    ).join(orders, orders.gadget_id == Gadget.id) \
+     .filter(orders.payment_status == "paid"), orders, start, end) \
+     .group_by(Gadget.id) \
+     .order_by(db.desc("total_rentals"))
+
+
+def most_rented_gadgets_rows(start=None, end=None):
+    return most_rented_gadgets_query(start, end).all()
+
+
+def user_activity_query(start=None, end=None):
+    orders = order_history(start)
+    return created_between(db.session.query(
+        User.name,
+        User.email,
+        User.phone,
+        db.func.count(orders.id).label("orders"),
+        db.func.sum(orders.total_price).label("revenue"),
+        db.func.avg(orders.total_price).label("avg_revenue"),
+        db.func.sum(orders.total_days).label("total_days"),
+        db.func.avg(orders.total_days).label("avg_days"),
+        db.func.max(orders.created_at).label("last_order")
+    ).join(orders, orders.user_id == User.id) \
+     .filter(orders.payment_status == "paid"), orders, start, end) \
+     .group_by(User.id) \
+     .order_by(db.desc("orders"))
+
+
+def user_activity_rows(start=None, end=None):
+    return user_activity_query(start, end).all()
+
+
+# --- Per-user summaries ---
+
+ORDER_STATUSES = ('booked', 'approved', 'active', 'delivered', 'overdue', 'returned', 'cancelled')
+
+
+def user_order_summaries(user_ids=None):
+    """
+    {user_id: summary} from one grouped query: order counts overall and per
+    status, lifetime spend (paid orders) and the last order time. Users
+    without orders are absent; see empty_order_summary(). Archived orders
+    are included.
+    """
+    orders = order_history()
+    query = db.session.query(
+        orders.user_id,
+        db.func.count(orders.id).label("orders"),
+        db.func.sum(db.case((orders.payment_status == 'paid', orders.total_price), else_=0)).label("spent"),
+        db.func.max(orders.created_at).label("last_order"),
+        *[db.func.sum(db.case((orders.status == status, 1), else_=0)).label(status)
+          for status in ORDER_STATUSES]
+    ).group_by(orders.user_id)
+    if user_ids is not None:
+        query = query.filter(orders.user_id.in_(user_ids))
+
+    return {row.user_id: {
+        "orders": row.orders,
+        "spent": row.spent or 0,
+        "last_order": row.last_order,
+        "by_status": {status: getattr(row, status) or 0 for status in ORDER_STATUSES},
+    } for row in query}
+
+
+def empty_order_summary():
+    return {"orders": 0, "spent": 0, "last_order": None, "by_status": dict.fromkeys(ORDER_STATUSES, 0)}
+
+
+def utilization_rows(start=None, end=None):
+    default_start, default_end = default_report_range()
+    return utilization_report(start or default_start, end or default_end)['gadgets']
+
+
+# --- Export format ---
+
+# report: (title, rows function, [(header, field, kind)], tables read)
+# kind: text, int, amount (2 decimals), percent (fraction shown as 0-100) or date
+REPORTS = {
+    'daily-revenue': ('Daily Revenue', daily_revenue_rows, [
+        ("Date", "date", "text"), ("Total Orders", "orders", "int"),
+        ("Revenue (₹)", "revenue", "amount"), ("Avg Revenue (₹)", "avg_revenue", "amount"),
+        ("Max Order (₹)", "max_order", "amount"), ("Min Order (₹)", "min_order", "amount"),
+        ("Unique Customers", "unique_customers", "int"), ("Total Rental Days", "total_days", "int"),
+        ("Avg Rental Days", "avg_days", "amount"),
+    ], ('rental_order',)),
+    'most-rented-gadgets': ('Most Rented Gadgets', most_rented_gadgets_rows, [
+        ("Gadget", "gadget", "text"), ("Category", "category", "text"),
+        ("Total Rentals", "total_rentals", "int"), ("Total Days", "total_days", "int"),
+        ("Unique Users", "unique_users", "int"), ("Total Revenue (₹)", "total_revenue", "amount"),
+        ("Avg Revenue (₹)", "avg_revenue", "amount"), ("Avg Days", "avg_days", "amount"),
+        ("Last Rented", "last_rented", "date"),
+    ], ('rental_order', 'gadget')),
+    'user-activity': ('User Activity', user_activity_rows, [
+        ("User", "name", "text"), ("Email", "email", "text"), ("Phone", "phone", "text"),
+        ("Total Orders", "orders", "int"), ("Total Revenue (₹)", "revenue", "amount"),
+        ("Avg Revenue (₹)", "avg_revenue", "amount"), ("Total Rental Days", "total_days", "int"),
+        ("Avg Days", "avg_days", "amount"), ("Last Order Date", "last_order", "date"),
+    ], ('rental_order', 'user')),
+    'utilization': ('Utilization', utilization_rows, [
+        ("Gadget", "gadget", "text"), ("Category", "category", "text"), ("Units", "capacity", "int"),
+        ("Unit-Days Rented", "unit_days", "int"), ("Unit-Days Available", "capacity_days", "int"),
+        ("Utilization (%)", "utilization", "percent"), ("Peak Units Out", "peak_units_out", "int"),
+        ("Fully Booked Days", "fully_booked_days", "int"),
+    ], ('rental_order', 'gadget')),
+}
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+
+def _field(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _csv_value(value, kind):
+    if kind == 'amount':
+        return f"{value or 0:.2f}"
+    if kind == 'percent':
+        return f"{(value or 0) * 100:.2f}"
+    if kind == 'date':
+        return value.strftime("%Y-%m-%d") if value else ""
+    if kind == 'int':
+        return value or 0
+    return value or ""
+
+
+def _json_value(value, kind):
+    if kind == 'amount':
+        return round(value or 0, 2)
+    if kind == 'percent':
+        return round((value or 0) * 100, 2)
+    if kind == 'date':
+        return value.strftime("%Y-%m-%d") if value else None
+    if kind == 'int':
+        return value or 0
+    return value
+
+
+# Reports an export can stream from SQL: report -> (query builder, row mapper)
+STREAMED_REPORTS = {
+    'daily-revenue': (daily_revenue_query, _daily_revenue_row),
+    'most-rented-gadgets': (most_rented_gadgets_query, None),
+    'user-activity': (user_activity_query, None),
+}
+
+
+def report_stream(report, start=None, end=None, batch_size=1000):
+    """
+    (row count, row iterator) for an export. SQL reports are counted with
+    COUNT(*) and read `batch_size` rows at a time, so a long range is never
+    held in memory; the rest are small and built in full.
+    """
+    if report not in STREAMED_REPORTS:
+        rows = REPORTS[report][1](start, end)
+        return len(rows), iter(rows)
+    query_fn, row_fn = STREAMED_REPORTS[report]
+    query = query_fn(start, end)
+    total = query.order_by(None).count()
+    rows = query.yield_per(batch_size)
+    return total, (map(row_fn, rows) if row_fn else iter(rows))
+
+
+def write_report(report, rows, out, fmt='csv', progress=None, progress_every=1000):
+    """
+    Write `rows` of `report` to the text stream `out` as CSV (with a header
+    row) or JSONL (one object per row, keyed by header). `progress(n)` is
+    called every `progress_every` rows and once at the end.
+    """
+    columns = REPORTS[report][2]
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow([header for header, _, _ in columns])
+
+    written = 0
+    for row in rows:
+        if fmt == 'csv':
+            writer.writerow([_csv_value(_field(row, name), kind) for _, name, kind in columns])
+        else:
+            out.write(json.dumps({header: _json_value(_field(row, name), kind)
+                                  for header, name, kind in columns}, ensure_ascii=False) + "\n")
+        written += 1
+        if progress and written % progress_every == 0:
+            progress(written)
+    if progress:
+        progress(written)
+    return written
+
+
+def report_csv(report, rows):
+    si = io.StringIO()
+    write_report(report, rows, si)
+    return si.getvalue()
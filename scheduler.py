@@ -0,0 +1,229 @@
+# scheduler.py
+# In-process background job scheduler backed by the Job table.
+#
+# Every gunicorn worker runs a scheduler thread. A job is claimed with a
+# conditional UPDATE that takes a time-limited lease, so only one worker runs
+# it. The poll thread keeps renewing the leases of jobs it is still running,
+# so a long job is never taken over; if the worker dies its leases stop being
+# renewed and, a full lease period after expiry, another worker picks it up.
+
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Job, JobRun
+
+
+TASKS = {}
+
+
+def register_task(name, func):
+    TASKS[name] = func
+
+
+def enqueue(task, run_at=None, max_attempts=3, **kwargs):
+    """Schedule a one-off run of a registered task. The caller commits."""
+    job = Job(task=task, args=json.dumps(kwargs), run_at=run_at or datetime.utcnow(),
+              max_attempts=max_attempts)
+    db.session.add(job)
+    return job
+
+
+def ensure_recurring(recurring):
+    """Create missing recurring jobs from {name: (task, interval_seconds)}."""
+    existing = {name for (name,) in Job.query.with_entities(Job.name)
+                                            .filter(Job.name.in_(recurring))}
+    for name, (task, interval) in recurring.items():
+        if name not in existing:
+            db.session.add(Job(name=name, task=task, args='{}', interval_seconds=interval,
+                               run_at=datetime.utcnow()))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created them first
+        db.session.rollback()
+
+
+class JobScheduler:
+    def __init__(self, app, recurring=None, workers=4, poll_interval=5,
+                 lease_seconds=300, retry_delay=30):
+        self.app = app
+        self.recurring = recurring or {}
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = timedelta(seconds=lease_seconds)
+        self.retry_delay = retry_delay
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job-worker')
+        self.in_flight = 0
+        self.running = set()
+        self.renewed_at = 0.0
+        self.lock = threading.Lock()
+        self.recurring_ready = False
+
+    def start(self):
+        thread = threading.Thread(target=self._poll_forever, name='job-scheduler', daemon=True)
+        thread.start()
+        return thread
+
+    def _poll_forever(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    if not self.recurring_ready:
+                        ensure_recurring(self.recurring)
+                        self.recurring_ready = True
+                    self._renew_leases()
+                    self._dispatch_due()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Job scheduler poll failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def _claimable(self, now):
+        # A running job is only taken over once its lease has gone unrenewed
+        # for a further lease period: its owner is gone, not just slow to poll
+        return db.and_(
+            Job.run_at <= now,
+            db.or_(
+                db.and_(Job.status == 'scheduled',
+                        db.or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < now)),
+                db.and_(Job.status == 'running', Job.lease_expires_at < now - self.lease)
+            )
+        )
+
+    def _renew_leases(self):
+        """Push out the leases of this worker's running jobs, every third of a lease."""
+        if time.monotonic() - self.renewed_at < self.lease.total_seconds() / 3:
+            return
+        with self.lock:
+            running = list(self.running)
+        if running:
+            Job.query.filter(Job.id.in_(running), Job.lease_owner == self.owner) \
+                     .update({Job.lease_expires_at: datetime.utcnow() + self.lease},
+                             synchronize_session=False)
+            db.session.commit()
+        self.renewed_at = time.monotonic()
+
+    def _dispatch_due(self):
+        with self.lock:
+            free = self.workers - self.in_flight
+        if free <= 0:
+            return
+
+        now = datetime.utcnow()
+        due = Job.query.with_entities(Job.id).filter(self._claimable(now)) \
+                       .order_by(Job.run_at).limit(free).all()
+        for (job_id,) in due:
+            claimed = Job.query.filter(Job.id == job_id, self._claimable(now)) \
+                               .update({Job.status: 'running', Job.lease_owner: self.owner,
+                                        Job.lease_expires_at: now + self.lease},
+                                       synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                with self.lock:
+                    self.in_flight += 1
+                    self.running.add(job_id)
+                self.pool.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                self._run_claimed(job_id)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.running.discard(job_id)
+
+    def _run_claimed(self, job_id):
+        job = db.session.get(Job, job_id)
+        started = datetime.utcnow()
+        latency_ms = int((started - job.run_at).total_seconds() * 1000)
+        error = None
+        try:
+            TASKS[job.task](**json.loads(job.args or '{}'))
+        except Exception as e:
+            db.session.rollback()
+            error = f"{type(e).__name__}: {e}"
+            self.app.logger.error(f"Job {job.task} (#{job_id}) failed: {error}")
+        duration_ms = int((datetime.utcnow() - started).total_seconds() * 1000)
+
+        job = db.session.get(Job, job_id)
+        db.session.add(JobRun(job_id=job_id, started_at=started, latency_ms=latency_ms,
+                              duration_ms=duration_ms, succeeded=error is None, error=error))
+
+        # Our lease ran out and another worker took the job over
+        if job.lease_owner != self.owner:
+            db.session.commit()
+            return
+
+        now = datetime.utcnow()
+        if error is None:
+            job.attempts = 0
+            job.last_error = None
+        else:
+            job.attempts = (job.attempts or 0) + 1
+            job.last_error = error
+
+        if error is not None and job.attempts < (job.max_attempts or 1):
+            job.status = 'scheduled'
+            job.run_at = now + timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1))
+        elif job.interval_seconds:
+            # Keep the cadence anchored to the schedule, not to when the run finished
+            job.status = 'scheduled'
+            job.attempts = 0
+            job.run_at = max(job.run_at + timedelta(seconds=job.interval_seconds), now)
+        else:
+            job.status = 'done' if error is None else 'failed'
+
+        job.lease_owner = None
+        job.lease_expires_at = None
+        db.session.commit()
+
+
+def prune_job_history(days=7):
+    """Drop old run records and finished one-off jobs."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    JobRun.query.filter(JobRun.started_at < cutoff).delete(synchronize_session=False)
+    finished = Job.query.with_entities(Job.id).filter(Job.interval_seconds.is_(None),
+                                                      Job.status.in_(('done', 'failed')),
+                                                      Job.run_at < cutoff)
+    JobRun.query.filter(JobRun.job_id.in_(finished.scalar_subquery())).delete(synchronize_session=False)
+    Job.query.filter(Job.interval_seconds.is_(None), Job.status.in_(('done', 'failed')),
+                     Job.run_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def job_stats(since_hours=24):
+    """Per-job run count, failures, latency and run time over the recent window."""
+    since = datetime.utcnow() - timedelta(hours=since_hours)
+    runs = db.session.query(
+        JobRun.job_id,
+        db.func.count(JobRun.id).label('runs'),
+        db.func.sum(db.case((JobRun.succeeded.is_(False), 1), else_=0)).label('failures'),
+        db.func.avg(JobRun.latency_ms).label('avg_latency_ms'),
+        db.func.max(JobRun.latency_ms).label('max_latency_ms'),
+        db.func.avg(JobRun.duration_ms).label('avg_duration_ms'),
+        db.func.max(JobRun.duration_ms).label('max_duration_ms'),
+        db.func.max(JobRun.started_at).label('last_started_at')
+    ).filter(JobRun.started_at >= since).group_by(JobRun.job_id).subquery()
+
+    return db.session.query(Job, runs).outerjoin(runs, runs.c.job_id == Job.id) \
+                     .order_by(Job.interval_seconds.is_(None), Job.run_at).all()
+
+
+def start_scheduler(app, recurring):
+    scheduler = JobScheduler(
+        app, recurring=recurring,
+        workers=app.config.get('SCHEDULER_WORKERS', 4),
+        poll_interval=app.config.get('SCHEDULER_POLL_SECONDS', 5),
+        lease_seconds=app.config.get('JOB_LEASE_SECONDS', 300)
+    )
+    scheduler.start()
+    return scheduler
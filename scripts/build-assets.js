@@ -0,0 +1,64 @@
+// Fingerprint static assets and write precompressed copies.
+//
+// Run after build-tailwind.js:  node scripts/build-assets.js
+//
+// For every CSS/JS file and default image directly under static/ this writes
+//   static/dist/<name>.<hash>.<ext>      (plus .gz and .br for text assets)
+// and static/dist/manifest.json mapping the logical name to the fingerprinted
+// one, which static_files.py uses to rewrite url_for('static', ...).
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const zlib = require('zlib');
+
+const staticDir = path.join(__dirname, '..', 'static');
+const distDir = path.join(staticDir, 'dist');
+
+const FINGERPRINT = /\.(css|js|png|jpe?g|gif|svg|webp|ico)$/i;
+const COMPRESS = /\.(css|js|svg)$/i;
+
+function build() {
+  fs.rmSync(distDir, { recursive: true, force: true });
+  fs.mkdirSync(distDir, { recursive: true });
+
+  const manifest = {};
+  let raw = 0, gz = 0, br = 0;
+
+  for (const name of fs.readdirSync(staticDir).sort()) {
+    const src = path.join(staticDir, name);
+    if (!fs.statSync(src).isFile() || !FINGERPRINT.test(name)) continue;
+
+    const data = fs.readFileSync(src);
+    const hash = crypto.createHash('sha256').update(data).digest('hex').slice(0, 12);
+    const ext = path.extname(name);
+    const outName = `${path.basename(name, ext)}.${hash}${ext}`;
+    const out = path.join(distDir, outName);
+    fs.writeFileSync(out, data);
+    manifest[name] = `dist/${outName}`;
+
+    if (COMPRESS.test(name)) {
+      const gzipped = zlib.gzipSync(data, { level: 9 });
+      const brotli = zlib.brotliCompressSync(data, {
+        params: {
+          [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+          [zlib.constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+        },
+      });
+      fs.writeFileSync(`${out}.gz`, gzipped);
+      fs.writeFileSync(`${out}.br`, brotli);
+      raw += data.length; gz += gzipped.length; br += brotli.length;
+    }
+  }
+
+  fs.writeFileSync(path.join(distDir, 'manifest.json'), JSON.stringify(manifest, null, 2) + '\n');
+  console.log(`Fingerprinted ${Object.keys(manifest).length} asset(s) into ${distDir}`);
+  if (raw) console.log(`Text assets: ${raw} bytes, gzip ${gz}, brotli ${br}`);
+}
+
+try {
+  build();
+} catch (err) {
+  console.error('Asset build failed:', err);
+  process.exitCode = 1;
+}
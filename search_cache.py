@@ -0,0 +1,127 @@
+# search_cache.py
+# Cache of catalog search results (gadget id lists) by normalized query.
+#
+# The filter/sort parameters of /gadgets are normalized into a key, so
+# "Sony", " sony " and "SONY" share an entry. Entries expire after a TTL and
+# are tagged with the gadget table version (see versions.py); any gadget
+# write moves the version, which invalidates every entry in every worker.
+# Per query shape (which filters are set, and the sort) the cache keeps hit
+# and miss counts and latencies for /admin/metrics.
+
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from extensions import db
+from models import Gadget
+from versions import table_versions
+
+
+SORT_OPTIONS = ('popularity', 'trending', 'price_low_high', 'newest')
+
+
+def normalize_catalog_query(category, search, min_price, max_price, sort_by):
+    """Canonical (category, search, min_price, max_price, sort_by) tuple."""
+    search = ' '.join((search or '').lower().split()) or None
+    return (
+        (category or '').strip() or None,
+        search,
+        round(min_price, 2) if min_price else None,
+        round(max_price, 2) if max_price else None,
+        sort_by if sort_by in SORT_OPTIONS else None,
+    )
+
+
+def query_shape(key):
+    category, search, min_price, max_price, sort_by = key
+    filters = [name for name, value in (('category', category), ('search', search),
+                                        ('min_price', min_price), ('max_price', max_price)) if value]
+    return f"{'+'.join(filters) or 'all'}/{sort_by or 'unsorted'}"
+
+
+def catalog_gadget_ids(key):
+    category, search, min_price, max_price, sort_by = key
+    query = db.session.query(Gadget.id).filter(Gadget.is_active == True)  # "= 1" (not "IS 1") lets SQLite use the index
+    if category:
+        query = query.filter(Gadget.category == category)
+    if search:
+        query = query.filter(Gadget.name.ilike(f'%{search}%'))
+    if min_price:
+        query = query.filter(Gadget.price_per_day >= min_price)
+    if max_price:
+        query = query.filter(Gadget.price_per_day <= max_price)
+
+    if sort_by == 'price_low_high':
+        query = query.order_by(Gadget.price_per_day.asc())
+    elif sort_by == 'popularity':
+        query = query.order_by(Gadget.rental_count.desc())
+    elif sort_by == 'trending':
+        query = query.order_by(Gadget.trending_score.desc())
+    elif sort_by == 'newest':
+        query = query.order_by(Gadget.created_at.desc())
+    return [gadget_id for (gadget_id,) in query]
+
+
+class SearchResultCache:
+    def __init__(self, max_entries=1000, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.entries = OrderedDict()  # key -> (ids, generation, expires_at)
+        self.shapes = defaultdict(lambda: {'hits': 0, 'misses': 0, 'hit_ms': 0.0, 'miss_ms': 0.0})
+        self.lock = threading.Lock()
+
+    def gadget_ids(self, key):
+        started = time.perf_counter()
+        generation = table_versions(['gadget'])['gadget'][0]
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            hit = entry is not None and entry[1] == generation and entry[2] > now
+            if hit:
+                self.entries.move_to_end(key)
+                ids = entry[0]
+        if not hit:
+            ids = catalog_gadget_ids(key)
+            with self.lock:
+                self.entries[key] = (ids, generation, now + self.ttl)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            shape = self.shapes[query_shape(key)]
+            shape['hits' if hit else 'misses'] += 1
+            shape['hit_ms' if hit else 'miss_ms'] += elapsed_ms
+        return ids
+
+    def stats(self):
+        with self.lock:
+            shapes = {}
+            for name, s in sorted(self.shapes.items()):
+                lookups = s['hits'] + s['misses']
+                shapes[name] = {
+                    'hits': s['hits'],
+                    'misses': s['misses'],
+                    'hit_rate': round(s['hits'] / lookups, 4) if lookups else None,
+                    'avg_hit_ms': round(s['hit_ms'] / s['hits'], 3) if s['hits'] else None,
+                    'avg_miss_ms': round(s['miss_ms'] / s['misses'], 3) if s['misses'] else None,
+                }
+            return {'entries': len(self.entries), 'max_entries': self.max_entries,
+                    'ttl_seconds': self.ttl, 'shapes': shapes}
+
+
+search_cache = SearchResultCache()
+
+
+def init_search_cache(app):
+    search_cache.max_entries = app.config.get('SEARCH_CACHE_MAX_ENTRIES', search_cache.max_entries)
+    search_cache.ttl = app.config.get('SEARCH_CACHE_TTL_SECONDS', search_cache.ttl)
+
+
+def hydrate_gadgets(ids):
+    """Load gadgets by id, in the order of `ids`."""
+    if not ids:
+        return []
+    by_id = {g.id: g for g in Gadget.query.filter(Gadget.id.in_(ids))}
+    return [by_id[gadget_id] for gadget_id in ids if gadget_id in by_id]
@@ -0,0 +1,102 @@
+# search_index.py
+# In-memory prefix index behind the typeahead suggest endpoint.
+#
+# Every active gadget contributes its full name, each word of its name and
+# its category as lowercase terms. Terms live in one sorted list, so a
+# prefix lookup is a bisect plus a short scan instead of an ILIKE table scan.
+# Matches are ranked by rental_count.
+#
+# The index is built on first use, patched in place by the admin gadget routes
+# and rebuilt in other workers once the gadget table version moves (checked
+# at most every SUGGEST_REFRESH_SECONDS).
+
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+
+from models import Gadget
+from versions import table_versions
+
+
+WORD = re.compile(r"[\w']+")
+
+
+def _terms(name, category):
+    name = (name or '').lower()
+    terms = {name} | set(WORD.findall(name))
+    if category:
+        terms.add(category.lower())
+    return {t for t in terms if t}
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.terms = []       # sorted (term, gadget_id)
+        self.gadgets = {}     # gadget_id -> (name, category, rental_count)
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        version = table_versions(['gadget'])['gadget'][0]
+        rows = Gadget.query.with_entities(Gadget.id, Gadget.name, Gadget.category, Gadget.rental_count) \
+                           .filter(Gadget.is_active.is_(True)).all()
+        gadgets = {gid: (name, category, rental_count or 0) for gid, name, category, rental_count in rows}
+        terms = sorted((term, gid) for gid, (name, category, _) in gadgets.items()
+                       for term in _terms(name, category))
+        with self.lock:
+            self.terms, self.gadgets, self.version = terms, gadgets, version
+            self.checked_at = time.monotonic()
+
+    def refresh_if_stale(self):
+        if self.version is None:
+            self.rebuild()
+            return
+        interval = current_app.config.get('SUGGEST_REFRESH_SECONDS', 30)
+        if time.monotonic() - self.checked_at < interval:
+            return
+        self.checked_at = time.monotonic()
+        if table_versions(['gadget'])['gadget'][0] != self.version:
+            self.rebuild()
+
+    def upsert(self, gadget):
+        """Reflect one gadget's current name/category/status without a full rebuild."""
+        with self.lock:
+            self._remove(gadget.id)
+            if gadget.is_active:
+                self.gadgets[gadget.id] = (gadget.name, gadget.category, gadget.rental_count or 0)
+                for term in _terms(gadget.name, gadget.category):
+                    insort(self.terms, (term, gadget.id))
+
+    def remove(self, gadget_id):
+        with self.lock:
+            self._remove(gadget_id)
+
+    def _remove(self, gadget_id):
+        old = self.gadgets.pop(gadget_id, None)
+        if old:
+            for term in _terms(old[0], old[1]):
+                i = bisect_left(self.terms, (term, gadget_id))
+                if i < len(self.terms) and self.terms[i] == (term, gadget_id):
+                    del self.terms[i]
+
+    def suggest(self, prefix, limit=8, scan_limit=500):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        with self.lock:
+            terms, gadgets = self.terms, self.gadgets
+            matched = set()
+            i = bisect_left(terms, (prefix,))
+            end = min(len(terms), i + scan_limit)
+            while i < end and terms[i][0].startswith(prefix):
+                matched.add(terms[i][1])
+                i += 1
+            ranked = sorted(matched, key=lambda gid: (-gadgets[gid][2], gadgets[gid][0]))[:limit]
+            return [(gid, gadgets[gid][0], gadgets[gid][1]) for gid in ranked]
+
+
+suggest_index = PrefixIndex()
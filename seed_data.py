@@ -5,6 +5,11 @@ os.makedirs(os.path.join(os.path.dirname(__file__), 'static', 'uploads'), exist_
 from app import app
 from extensions import db
 from models import User, Gadget, RentalOrder, Review, Feedback, Notification
+from inventory import open_stock_ledger
+from trust import recompute_trust_scores
+from trending import recompute_trending_scores
+from recommendations import rebuild_recommendations
+from images import reset_missing_images
 from werkzeug.security import generate_password_hash
 from datetime import datetime, date, timedelta
 import random
@@ -303,6 +308,11 @@ with app.app_context():
     db.session.commit()
     print(f"{len(gadgets)} gadgets inserted.")
 
+    # Opening balances for the stock movement ledger
+    open_stock_ledger()
+    db.session.commit()
+    print("Stock ledger opened.")
+
     # -----------------------------------------------------------
     # 3️⃣ ORDERS (2–3 per user)
     # -----------------------------------------------------------
@@ -422,4 +432,15 @@ with app.app_context():
     db.session.commit()
     print("Notifications added.")
 
+    # Backfill trust scores from the seeded rental history
+    recompute_trust_scores()
+    print("Trust scores computed.")
+
+    recompute_trending_scores()
+    print("Trending scores computed.")
+
+    print(f"{rebuild_recommendations()} recommendations built.")
+
+    print(f"{reset_missing_images()} gadget(s) without an image file reset to the default image.")
+
     print("\nDEMO DATA SEEDING COMPLETE!")
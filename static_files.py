@@ -0,0 +1,102 @@
+# static_files.py
+# How /static (including uploads) is served.
+#
+# STATIC_SERVING selects the mode:
+#   'flask'   - Flask streams the file itself (ETag, Range and If-None-Match /
+#               If-Modified-Since are handled by werkzeug's send_file).
+#   'sendfile' - Flask answers with an X-Sendfile header (Apache mod_xsendfile,
+#               lighttpd) and the front server sends the bytes.
+#   'accel'   - Flask answers with X-Accel-Redirect for nginx, e.g.
+#
+#       location /_static/ {
+#           internal;
+#           alias /srv/gadget-rental/static/;
+#           gzip_static on;
+#           brotli_static on;
+#       }
+#
+# In the offloaded modes Flask only resolves the path; the front server does
+# sendfile(), conditional GET and Range requests.
+#
+# scripts/build-assets.js fingerprints CSS/JS/default images into static/dist
+# and writes a manifest; url_for('static', filename='output.css') then yields
+# the fingerprinted name, which is cached for a year. When the client accepts
+# it, Flask serves the precompressed .br/.gz sibling.
+
+import json
+import mimetypes
+import os
+
+from flask import abort, current_app, request, Response
+from werkzeug.security import safe_join
+
+from images import VARIANT_DIR
+
+
+# Files under these prefixes are named by content and never change in place
+IMMUTABLE_PREFIXES = ('dist/', f"{VARIANT_DIR}/")
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+def load_manifest(app):
+    path = os.path.join(app.static_folder, 'dist', 'manifest.json')
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _precompressed(path):
+    """(encoding, path) of the best precompressed sibling the client accepts."""
+    for encoding, suffix in PRECOMPRESSED:
+        if encoding in request.accept_encodings and os.path.isfile(path + suffix):
+            return encoding, path + suffix
+    return None, path
+
+
+def serve_static(filename):
+    mode = current_app.config.get('STATIC_SERVING', 'flask')
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    immutable = filename.startswith(IMMUTABLE_PREFIXES)
+
+    if mode == 'accel':
+        prefix = current_app.config.get('STATIC_ACCEL_PREFIX', '/_static/').rstrip('/')
+        response = Response(status=200)
+        response.headers['X-Accel-Redirect'] = f"{prefix}/{filename}"
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    else:
+        # 'sendfile' goes through the same path with USE_X_SENDFILE enabled
+        encoding, send_path = _precompressed(path) if immutable else (None, path)
+        if encoding:
+            response = current_app.send_static_file(os.path.relpath(send_path, current_app.static_folder))
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response.content_encoding = encoding
+        else:
+            response = current_app.send_static_file(filename)
+        if immutable and any(os.path.isfile(path + suffix) for _, suffix in PRECOMPRESSED):
+            response.vary.add('Accept-Encoding')
+
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    return response
+
+
+def init_static_serving(app):
+    mode = app.config.setdefault('STATIC_SERVING', 'flask')
+    if mode not in ('flask', 'sendfile', 'accel'):
+        raise ValueError(f"Unknown STATIC_SERVING mode: {mode}")
+    app.config['USE_X_SENDFILE'] = mode == 'sendfile'
+    app.view_functions['static'] = serve_static
+
+    manifest = load_manifest(app)
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
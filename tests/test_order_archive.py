@@ -0,0 +1,69 @@
+# tests/test_order_archive.py
+
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy.schema import CreateTable
+
+from extensions import db
+from models import RentalOrder, ArchivedRentalOrder
+from order_archive import archive_closed_orders, migrate_order_ids
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'orders.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _order(status='booked', days_ago=0):
+    when = datetime.utcnow() - timedelta(days=days_ago)
+    return RentalOrder(user_id=1, gadget_id=1, start_date=when.date(), end_date=when.date(),
+                       status=status, deposit_returned=True, created_at=when)
+
+
+def _add_orders():
+    orders = [_order(), _order(), _order('cancelled', days_ago=400)]
+    db.session.add_all(orders)
+    db.session.commit()
+    return orders
+
+
+def test_new_order_after_archiving_the_newest_gets_a_new_id(app):
+    newest = _add_orders()[-1].id
+
+    assert archive_closed_orders() == 1
+    assert db.session.get(ArchivedRentalOrder, newest) is not None
+
+    order = _order()
+    db.session.add(order)
+    db.session.commit()
+    assert order.id > newest
+
+
+def test_migrate_order_ids_rebuilds_a_table_without_autoincrement(app):
+    table = RentalOrder.__table__
+    ddl = str(CreateTable(table).compile(dialect=db.engine.dialect)).replace(' AUTOINCREMENT', '')
+    table.drop(db.engine)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(ddl)
+    newest = _add_orders()[-1].id
+    db.session.execute(db.insert(ArchivedRentalOrder).values(id=newest + 5, status='returned',
+                                                             created_date=date.today()))
+    db.session.commit()
+    db.session.remove()
+
+    assert migrate_order_ids() is True
+    assert migrate_order_ids() is False
+    assert RentalOrder.query.count() == 3
+
+    order = _order()
+    db.session.add(order)
+    db.session.commit()
+    assert order.id > newest + 5
@@ -0,0 +1,91 @@
+# trending.py
+# Exponentially time-decayed rental popularity.
+#
+# A rental of q units at time t is worth q * 2^(-(now - t) / half_life).
+# Decaying every row continuously would rewrite the whole table, so the
+# stored Gadget.trending_score is the same sum scaled by 2^((t - EPOCH) /
+# half_life) instead: every gadget shares the factor 2^(-(now - EPOCH) /
+# half_life), so the ordering is the same and a plain index on the column
+# serves the sort. New orders only add their own term.
+#
+# EPOCH is stored (TrendingEpoch) and moved to the current day by every
+# daily recompute, so the exponent stays within a few half-lives and the
+# float cannot overflow however short the half-life is.
+
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models import Gadget, TrendingEpoch
+from order_archive import order_history
+
+
+def _half_life_seconds():
+    days = current_app.config.get('TRENDING_HALF_LIFE_DAYS', 14)
+    if not days or days <= 0:
+        raise ValueError(f"TRENDING_HALF_LIFE_DAYS must be positive, got {days!r}")
+    return days * 86400.0
+
+
+def trending_epoch():
+    """The stored epoch; created (as today) if no recompute has run yet."""
+    epoch = db.session.query(TrendingEpoch.epoch).filter(TrendingEpoch.id == 1).scalar()
+    if epoch is None:
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        db.session.execute(sqlite_insert(TrendingEpoch).values(id=1, epoch=today)
+                                                       .on_conflict_do_nothing(index_elements=['id']))
+        epoch = db.session.query(TrendingEpoch.epoch).filter(TrendingEpoch.id == 1).scalar()
+    return epoch
+
+
+def trending_weight(quantity, at=None):
+    """Stored-score contribution of renting `quantity` units at `at`."""
+    elapsed = ((at or datetime.utcnow()) - trending_epoch()).total_seconds()
+    return quantity * 2.0 ** (elapsed / _half_life_seconds())
+
+
+def current_trending_score(stored, now=None):
+    """Decayed score as of `now`, for display."""
+    elapsed = ((now or datetime.utcnow()) - trending_epoch()).total_seconds()
+    return (stored or 0.0) * 2.0 ** (-elapsed / _half_life_seconds())
+
+
+def recompute_trending_scores():
+    """
+    Rebuild every gadget's score from the order history in one vectorized
+    pass, against a new epoch at the start of today.
+    """
+    epoch = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    gadget_ids = np.array([gadget_id for (gadget_id,) in db.session.query(Gadget.id)], dtype=np.int64)
+    if gadget_ids.size == 0:
+        return 0
+    gadget_ids.sort()
+    scores = np.zeros(gadget_ids.size)
+
+    history = order_history()
+    orders = db.session.query(history.gadget_id, history.quantity, history.created_at) \
+                       .filter(history.gadget_id.isnot(None), history.created_at.isnot(None)).all()
+    if orders:
+        order_gadget, quantity, created_at = zip(*orders)
+        order_gadget = np.array(order_gadget, dtype=np.int64)
+        elapsed = (np.array(created_at, dtype='datetime64[us]') - np.datetime64(epoch, 'us')) \
+            / np.timedelta64(1, 's')
+        weights = np.array([q or 1 for q in quantity], dtype=np.float64) * np.exp2(elapsed / _half_life_seconds())
+
+        index = np.searchsorted(gadget_ids, order_gadget)
+        known = (index < gadget_ids.size) & (gadget_ids[np.minimum(index, gadget_ids.size - 1)] == order_gadget)
+        scores += np.bincount(index[known], weights=weights[known], minlength=gadget_ids.size)
+
+    db.session.execute(db.update(Gadget), [
+        {'id': gadget_id, 'trending_score': score}
+        for gadget_id, score in zip(gadget_ids.tolist(), scores.tolist())
+    ])
+    db.session.execute(sqlite_insert(TrendingEpoch).values(id=1, epoch=epoch)
+                                                   .on_conflict_do_update(index_elements=['id'],
+                                                                          set_={'epoch': epoch}))
+    db.session.commit()
+    return int(gadget_ids.size)
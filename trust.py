@@ -0,0 +1,98 @@
+# trust.py
+# User trust score derived from rental history.
+#
+# Each event adds its weight to User.trust_points (unbounded);
+# trust_score is TRUST_BASE + trust_points clamped to [TRUST_MIN, TRUST_MAX].
+# Events are applied incrementally as orders change status, and
+# recompute_trust_scores() rebuilds everything from history for backfills.
+
+from collections import defaultdict
+
+import numpy as np
+
+from extensions import db
+from models import User, Review
+from order_archive import order_history
+
+
+TRUST_BASE = 100
+TRUST_MIN = 0
+TRUST_MAX = 200
+
+TRUST_WEIGHTS = {
+    'on_time_return': 2,    # returned without ever going overdue
+    'overdue': -10,         # went past its end date
+    'cancelled': -3,        # cancelled by the user
+    'deposit_refunded': 1,  # returned in good condition
+    'review': 1,
+}
+
+
+def _clamped(score):
+    return db.case((score < TRUST_MIN, TRUST_MIN), (score > TRUST_MAX, TRUST_MAX), else_=score)
+
+
+def apply_trust_events(events):
+    """Apply (user_id, event) pairs with a single UPDATE. The caller commits."""
+    delta = defaultdict(int)
+    for user_id, event in events:
+        delta[user_id] += TRUST_WEIGHTS[event]
+    delta = {user_id: d for user_id, d in delta.items() if d}
+    if not delta:
+        return
+
+    change = db.case(delta, value=User.id, else_=0)
+    User.query.filter(User.id.in_(delta)).update({
+        User.trust_points: User.trust_points + change,
+        User.trust_score: _clamped(TRUST_BASE + User.trust_points + change),
+    }, synchronize_session=False)
+
+
+def _positions(user_ids, ids):
+    """Index of each id in the sorted user_ids, and a mask of ids that exist."""
+    index = np.searchsorted(user_ids, ids)
+    known = (index < user_ids.size) & (user_ids[np.minimum(index, user_ids.size - 1)] == ids)
+    return index, known
+
+
+def recompute_trust_scores():
+    """Full rebuild from order and review history, vectorized with NumPy."""
+    user_ids = np.array([user_id for (user_id,) in db.session.query(User.id)], dtype=np.int64)
+    if user_ids.size == 0:
+        return 0
+    user_ids.sort()
+    points = np.zeros(user_ids.size, dtype=np.int64)
+
+    history = order_history()
+    orders = db.session.query(history.user_id, history.status, history.late_fee,
+                              history.deposit_returned, history.cancelled_by).all()
+    if orders:
+        order_user, status, late_fee, refunded, cancelled_by = zip(*orders)
+        index, known = _positions(user_ids, np.array([u or 0 for u in order_user], dtype=np.int64))
+        status = np.array(status, dtype=object)
+        went_overdue = np.array([fee or 0 for fee in late_fee], dtype=np.float64) > 0
+        refunded = np.array([bool(r) for r in refunded])
+        by_user = np.array(cancelled_by, dtype=object) == 'user'
+
+        weights = (
+            TRUST_WEIGHTS['on_time_return'] * ((status == 'returned') & ~went_overdue)
+            + TRUST_WEIGHTS['overdue'] * went_overdue
+            + TRUST_WEIGHTS['cancelled'] * ((status == 'cancelled') & by_user)
+            + TRUST_WEIGHTS['deposit_refunded'] * refunded
+        )
+        points += np.bincount(index[known], weights=weights[known],
+                              minlength=user_ids.size).astype(np.int64)
+
+    reviewers = np.array([user_id for (user_id,) in db.session.query(Review.user_id)
+                          if user_id is not None], dtype=np.int64)
+    if reviewers.size:
+        index, known = _positions(user_ids, reviewers)
+        points += TRUST_WEIGHTS['review'] * np.bincount(index[known], minlength=user_ids.size)
+
+    scores = np.clip(TRUST_BASE + points, TRUST_MIN, TRUST_MAX)
+    db.session.execute(db.update(User), [
+        {'id': user_id, 'trust_points': p, 'trust_score': s}
+        for user_id, p, s in zip(user_ids.tolist(), points.tolist(), scores.tolist())
+    ])
+    db.session.commit()
+    return int(user_ids.size)
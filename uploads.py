@@ -0,0 +1,64 @@
+# uploads.py
+# Content-addressed storage for uploaded gadget images.
+#
+# An upload is streamed to a temp file while it is hashed and then stored as
+# static/uploads/<sha256>.<ext>, so identical images are kept once and two
+# different files with the same name never overwrite each other. Gadget.image
+# is the reference: a blob is deleted only when no gadget points at it.
+
+import hashlib
+import os
+import tempfile
+
+from flask import current_app
+from models import Gadget
+
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+EXTENSION_ALIASES = {'jpeg': 'jpg'}
+
+
+def store_upload(file_storage):
+    """Save an uploaded file under its content hash and return its path relative to /static."""
+    folder = current_app.config['UPLOAD_FOLDER']
+    ext = file_storage.filename.rsplit('.', 1)[1].lower()
+    ext = EXTENSION_ALIASES.get(ext, ext)
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file_storage.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        filename = f"{digest.hexdigest()}.{ext}"
+        final_path = os.path.join(folder, filename)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)  # already stored
+        else:
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return f"uploads/{filename}"
+
+
+def upload_ref_count(image):
+    return Gadget.query.filter(Gadget.image == image).count()
+
+
+def release_upload(image):
+    """
+    Delete an uploaded blob if no gadget references it any more. Call once the
+    change that dropped the reference is committed. Returns True if removed.
+    """
+    if not image or not image.startswith('uploads/'):
+        return False
+    if upload_ref_count(image):
+        return False
+    try:
+        os.remove(os.path.join(current_app.root_path, 'static', image))
+    except FileNotFoundError:
+        return False
+    return True
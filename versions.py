@@ -0,0 +1,95 @@
+# versions.py
+# Per-table version counters used as cache validators.
+#
+# Any commit that wrote to a versioned table bumps that table's row in
+# TableVersion inside the same transaction, whether the write came from the
+# unit of work (add/modify/delete) or a bulk insert/update/delete statement.
+# Readers compare versions to tell whether cached output is still current.
+
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import TableVersion
+
+
+VERSIONED_TABLES = {'gadget', 'review', 'user', 'gadget_recommendation', 'rental_order'}
+
+_TOUCHED = 'touched_tables'
+
+
+def _touch(session, table_name):
+    if table_name in VERSIONED_TABLES:
+        session.info.setdefault(_TOUCHED, set()).add(table_name)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed(session, flush_context):
+    for obj in session.new | session.deleted:
+        _touch(session, getattr(obj, '__tablename__', None))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            _touch(session, getattr(obj, '__tablename__', None))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk(orm_execute_state):
+    # Writes that should not invalidate anything opt out with bump_versions=False
+    if not orm_execute_state.execution_options.get('bump_versions', True):
+        return
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(getattr(orm_execute_state.statement, 'table', None), 'name', None)
+    if table not in VERSIONED_TABLES:
+        return
+    # Only statements that changed a row count; the hold sweeper's UPDATE runs
+    # every minute and almost always matches nothing. RETURNING results are
+    # buffered to count their rows (rowcount is not known until they are read).
+    statement = orm_execute_state.statement
+    result = orm_execute_state.invoke_statement()
+    if isinstance(result, CursorResult) and not result.returns_rows:
+        changed = result.rowcount != 0  # -1 (unknown) counts as a change
+    elif len(statement.exported_columns):
+        frozen = result.freeze()
+        changed = bool(frozen.data)
+        result = frozen()
+    else:
+        changed = True  # ORM bulk writes by primary key report no rowcount
+    if changed:
+        _touch(orm_execute_state.session, table)
+    return result
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(session):
+    session.flush()  # pending changes would otherwise be flushed after this hook
+    touched = session.info.pop(_TOUCHED, None)
+    if not touched:
+        return
+    now = datetime.utcnow()
+    stmt = sqlite_insert(TableVersion).values([
+        {'name': name, 'version': 1, 'updated_at': now} for name in sorted(touched)
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TableVersion.name],
+        set_={'version': TableVersion.version + 1, 'updated_at': now}
+    )
+    session.execute(stmt)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched(session):
+    session.info.pop(_TOUCHED, None)
+
+
+def table_versions(names):
+    """{name: (version, updated_at)} for the given tables; unknown tables are (0, None)."""
+    rows = db.session.query(TableVersion.name, TableVersion.version, TableVersion.updated_at) \
+                     .filter(TableVersion.name.in_(names)).all()
+    versions = {name: (0, None) for name in names}
+    versions.update({name: (version, updated_at) for name, version, updated_at in rows})
+    return versions